@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Car, Bid, AuctionHistory, CarImage
+from .models import Car, Bid, AuctionHistory, CarImage, AuctionWatchers
 
 @admin.register(Car)
 class CarAdmin(admin.ModelAdmin):
@@ -25,3 +25,8 @@ class AuctionHistoryAdmin(admin.ModelAdmin):
     list_display = ('car', 'winner', 'final_price', 'ended_at')
     list_filter = ('ended_at',)
     search_fields = ('car__brand', 'car__model', 'winner__username')
+
+@admin.register(AuctionWatchers)
+class AuctionWatchersAdmin(admin.ModelAdmin):
+    list_display = ('car', 'process', 'count', 'updated_at')
+    search_fields = ('car__brand', 'car__model', 'process')
@@ -0,0 +1,133 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.response import Response
+
+# Версии лотов и поколения списков - случайные метки, а не счетчики:
+# вытесненная из кэша метка не может совпасть со старой
+LISTING_GENERATION = 'car_listing_gen'
+PRICE_GENERATION = 'car_listing_price_gen'
+WRITE_SEQUENCE = 'car_write_seq'
+
+# Параметры списка, результат которых зависит от текущих цен лотов
+PRICE_PARAMS = ('min_price', 'max_price')
+PRICE_SORTS = ('price_asc', 'price_desc')
+
+
+def car_version_key(car_id):
+    return f'car_version:{car_id}'
+
+
+def get_versions(car_ids):
+    versions = cache.get_many([car_version_key(car_id) for car_id in car_ids])
+    return {car_id: versions.get(car_version_key(car_id)) for car_id in car_ids}
+
+
+def invalidate_cars(car_ids, listings=False, prices=False):
+    """
+    Сбрасывает закэшированные ответы с указанными лотами.
+    listings - изменился состав списков (новый, удаленный или завершенный лот),
+    prices - изменились цены (результаты фильтров и сортировок по цене)
+    """
+    updates = {car_version_key(car_id): uuid.uuid4().hex for car_id in car_ids}
+    if listings:
+        updates[LISTING_GENERATION] = uuid.uuid4().hex
+    if prices or listings:
+        updates[PRICE_GENERATION] = uuid.uuid4().hex
+    updates[WRITE_SEQUENCE] = uuid.uuid4().hex
+    cache.set_many(updates, None)
+
+
+def listing_generations(params):
+    """
+    Поколения, от которых зависит состав списка лотов с параметрами params:
+    поколение списков и, для фильтров и сортировок по цене, поколение цен
+    """
+    names = [LISTING_GENERATION]
+    if params.get('sort') in PRICE_SORTS or any(params.get(name) for name in PRICE_PARAMS):
+        names.append(PRICE_GENERATION)
+    generations = cache.get_many(names)
+    return tuple(generations.get(name) for name in names)
+
+
+def refresh_time_remaining(cars):
+    """
+    Пересчитывает time_remaining лотов закэшированного ответа по end_time,
+    как Car.time_remaining: в кэше значение устаревает на время жизни записи
+    """
+    now = timezone.now()
+    for car in cars:
+        if 'time_remaining' not in car:
+            continue
+        end_time = parse_datetime(car['end_time']) if car.get('end_time') else None
+        if car.get('status') != 'active' or end_time is None or now > end_time:
+            car['time_remaining'] = 0
+        else:
+            car['time_remaining'] = int((end_time - now).total_seconds())
+
+
+class CachedResponseMixin:
+    """
+    Кэш ответов GET для представлений лотов (read-through).
+
+    Ключ строится по пути, хосту и отсортированным параметрам запроса
+    (без параметра "_" для обхода кэша браузера). Вместе с ответом хранятся
+    версии лотов, попавших в него; при чтении версии сверяются, и изменение
+    любого из лотов (ставка, завершение, изменение лота или фото) делает
+    запись недействительной. Списки дополнительно зависят от поколения
+    списков, а списки с фильтром или сортировкой по цене - от поколения цен.
+    Оставшееся время лотов пересчитывается при каждом чтении из кэша.
+    """
+
+    cache_prefix = 'car_response'
+    cache_anonymous_only = True
+
+    def get(self, request, *args, **kwargs):
+        if self.cache_anonymous_only and request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None and get_versions(entry['versions']) == entry['versions']:
+            refresh_time_remaining(self.get_response_cars(entry['data']))
+            return Response(entry['data'])
+
+        write_sequence = cache.get(WRITE_SEQUENCE)
+        response = super().get(request, *args, **kwargs)
+
+        # Ответ не кэшируется, если за время его построения лоты изменились
+        if response.status_code == 200 and cache.get(WRITE_SEQUENCE) == write_sequence:
+            versions = get_versions([car['id'] for car in self.get_response_cars(response.data)])
+            cache.set(key, {'versions': versions, 'data': response.data},
+                      getattr(settings, 'AUCTION_RESPONSE_CACHE_TTL', 60))
+        return response
+
+    def get_response_cache_key(self, request):
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists() if name != '_'
+            for value in values
+        )
+        generations = self.get_generations(dict(params))
+        raw = f'{request.get_host()}|{request.path}|{params}|{generations}'
+        return f'{self.cache_prefix}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get_generations(self, params):
+        return ()
+
+    def get_response_cars(self, data):
+        return [data]
+
+
+class CachedListMixin(CachedResponseMixin):
+    cache_prefix = 'car_list'
+
+    def get_generations(self, params):
+        return listing_generations(params)
+
+    def get_response_cars(self, data):
+        return data['results'] if isinstance(data, dict) else data
@@ -1,22 +1,30 @@
+import asyncio
 import json
 import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from decimal import Decimal
 from .models import Car, Bid
+from .order_book import order_book, time_remaining
+from .presence import watchers
+from .replay import bid_history
+from urllib.parse import parse_qs
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.utils import timezone
+from config.outbound import OutboundQueueMixin
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
-class AuctionConsumer(AsyncWebsocketConsumer):
+class AuctionConsumer(OutboundQueueMixin, AsyncWebsocketConsumer):
     async def connect(self):
         try:
             self.auction_id = self.scope['url_route']['kwargs']['auction_id']
             self.auction_group_name = f'auction_{self.auction_id}'
 
             logger.info(f"Attempting to connect to auction {self.auction_id}")
-            logger.debug(f"Connection scope: {self.scope}")
 
             # Join auction group
             await self.channel_layer.group_add(
@@ -26,17 +34,28 @@ class AuctionConsumer(AsyncWebsocketConsumer):
 
             await self.accept()
 
-            # Send current auction state to the newly connected client
-            car = await self.get_car(self.auction_id)
-            if car:
+            # Начальное состояние берется из книги ставок, БД читается только
+            # если лот еще не загружен в этом процессе
+            lot = order_book.peek(int(self.auction_id))
+            if lot is None:
+                lot = await self.get_lot(int(self.auction_id))
+            if lot:
+                watchers.add(lot.car_id, self)
                 logger.info(f"Sending initial state for auction {self.auction_id}")
                 await self.send(text_data=json.dumps({
                     'type': 'auction_state',
-                    'car_id': car['id'],
-                    'current_price': float(car['current_price']),
-                    'status': car['status'],
-                    'time_remaining': car['time_remaining'],
+                    'car_id': lot.car_id,
+                    'current_price': float(lot.price),
+                    'status': lot.status,
+                    'time_remaining': time_remaining(lot),
+                    'watchers': watchers.count(lot.car_id),
+                    'seq': lot.bid_count,
                 }))
+
+                # Клиент, переподключившийся с ?last_seq=N, получает пропущенные ставки
+                last_seq = parse_qs(self.scope.get('query_string', b'').decode()).get('last_seq')
+                if last_seq:
+                    await self.resume(lot, last_seq[0])
             else:
                 logger.warning(f"Car not found for auction {self.auction_id}")
         except Exception as e:
@@ -45,6 +64,8 @@ class AuctionConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         try:
+            watchers.remove(int(self.auction_id), self)
+
             # Leave auction group
             await self.channel_layer.group_discard(
                 self.auction_group_name,
@@ -62,7 +83,11 @@ class AuctionConsumer(AsyncWebsocketConsumer):
 
             # Handle different types of messages
             message_type = data.get('type')
-            if message_type == 'bid':
+            if message_type == 'resume':
+                lot = order_book.peek(int(self.auction_id)) or await self.get_lot(int(self.auction_id))
+                if lot:
+                    await self.resume(lot, data.get('last_seq'))
+            elif message_type == 'bid':
                 # Handle bid message
                 await self.channel_layer.group_send(
                     self.auction_group_name,
@@ -74,35 +99,110 @@ class AuctionConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error in receive for auction {self.auction_id}: {str(e)}")
 
+    async def resume(self, lot, last_seq):
+        """
+        Досылает клиенту ставки после last_seq из буфера последних событий,
+        а если буфер их не покрывает - полный список ставок лота
+        """
+        try:
+            last_seq = int(last_seq)
+        except (TypeError, ValueError):
+            return
+
+        messages = bid_history.since(lot.car_id, last_seq, lot.bid_count)
+        if messages is not None:
+            logger.debug(f"Replaying {len(messages)} bids for auction {self.auction_id} after seq {last_seq}")
+            for message in messages:
+                await self.queue_send(message)
+            return
+
+        logger.debug(f"Sending bids snapshot for auction {self.auction_id}, seq {last_seq} is not buffered")
+        bids = await self.get_bids(lot.car_id)
+        await self.queue_send(json.dumps({
+            'type': 'bids_list',
+            'car_id': lot.car_id,
+            'seq': len(bids),
+            'bids': bids,
+        }))
+
     async def bid_update(self, event):
         try:
-            # Forward the bid update to WebSocket
-            await self.send(text_data=event['message'])
+            if 'current_price' in event:
+                order_book.observe(int(self.auction_id), price=Decimal(event['current_price']))
+            if 'seq' in event:
+                bid_history.record(int(self.auction_id), event['seq'], event['message'])
+            # Forward the pre-encoded bid update to WebSocket as is.
+            # Ставки не теряются и не объединяются: клиент ведет по ним список и seq,
+            # отстающий клиент закрывается и догоняет через resume
+            await self.queue_send(event['message'])
             logger.debug(f"Sent bid update for auction {self.auction_id}")
         except Exception as e:
             logger.error(f"Error in bid_update for auction {self.auction_id}: {str(e)}")
 
+    async def auction_state(self, event):
+        try:
+            if 'status' in event:
+                order_book.observe(int(self.auction_id), status=event['status'])
+            # Forward the auction state change (e.g. completion) to WebSocket.
+            # Состояние - снимок: неотправленный кадр заменяется более свежим
+            await self.queue_send(event['message'], key='auction_state')
+            logger.debug(f"Sent auction state for auction {self.auction_id}")
+        except Exception as e:
+            logger.error(f"Error in auction_state for auction {self.auction_id}: {str(e)}")
+
     @database_sync_to_async
-    def get_car(self, car_id):
-        try:
-            car = Car.objects.get(id=car_id)
-            return {
-                'id': car.id,
-                'current_price': car.current_price,
-                'status': car.status,
-                'time_remaining': car.time_remaining(),
+    def get_bids(self, car_id):
+        return [
+            {
+                'id': bid.id,
+                'amount': float(bid.amount),
+                'created_at': bid.created_at.isoformat(),
+                'bidder': {
+                    'id': bid.bidder_id,
+                    'username': bid.bidder.username
+                }
             }
-        except Car.DoesNotExist:
-            logger.warning(f"Car {car_id} not found")
-            return None
+            for bid in Bid.objects.filter(car_id=car_id).select_related('bidder').order_by('-amount')
+        ]
+
+    @database_sync_to_async
+    def get_lot(self, car_id):
+        try:
+            return order_book.get(car_id)
         except Exception as e:
             logger.error(f"Error getting car {car_id}: {str(e)}")
             return None
 
 class AuctionsConsumer(AsyncWebsocketConsumer):
+    """
+    Общая лента изменений лотов для страниц со списком аукционов.
+
+    Обновления по лотам не пересылаются по одному: за окно
+    AUCTIONS_FEED_WINDOW секунд сохраняется только последнее состояние
+    каждого лота, после чего клиенту уходит один кадр auction_updates
+    со списком изменившихся лотов. Так частота исходящих сообщений
+    ограничена независимо от интенсивности торгов.
+
+    По умолчанию сокет получает обновления всех лотов. Клиент может прислать
+    {"type": "subscribe", "car_ids": [...]} или {"type": "subscribe",
+    "filter": {...параметры CarFilterView, включая page и page_size...}},
+    после чего будет получать обновления только этих лотов через группы
+    auction_feed_{id}; {"type": "unsubscribe", "car_ids": [...]} отменяет
+    подписку (без car_ids - на все лоты). В ответ клиент получает текущий
+    список подписок, а если подписка превысила max_subscriptions - еще и
+    {"type": "error", "code": "subscription_limit", ...} с отклоненными id.
+    """
+
+    max_subscriptions = 100
+
     async def connect(self):
         try:
             self.group_name = 'auctions'
+            self.feed_window = getattr(settings, 'AUCTIONS_FEED_WINDOW', 0.25)
+            self.pending_updates = {}
+            self.flush_task = None
+            self.subscribed_ids = set()
+            self.in_global_feed = True
             logger.info("Attempting to connect to auctions group")
 
             # Join auctions group
@@ -118,25 +218,138 @@ class AuctionsConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         try:
-            # Leave auctions group
-            await self.channel_layer.group_discard(
-                self.group_name,
-                self.channel_name
-            )
+            if self.flush_task:
+                self.flush_task.cancel()
+
+            # Leave auctions group and per-lot groups
+            if self.in_global_feed:
+                await self.channel_layer.group_discard(
+                    self.group_name,
+                    self.channel_name
+                )
+            await self.unsubscribe(list(self.subscribed_ids))
             logger.info(f"Disconnected from auctions with code {close_code}")
         except Exception as e:
             logger.error(f"Error in disconnect for auctions: {str(e)}")
 
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+            message_type = data.get('type')
+
+            if message_type == 'subscribe':
+                car_ids = self.parse_car_ids(data.get('car_ids'))
+                if isinstance(data.get('filter'), dict):
+                    car_ids += await self.resolve_filter(data['filter'])
+                rejected = await self.subscribe(car_ids)
+                if rejected:
+                    await self.send(text_data=json.dumps({
+                        'type': 'error',
+                        'code': 'subscription_limit',
+                        'message': f'Не более {self.max_subscriptions} подписок на лоты',
+                        'max_subscriptions': self.max_subscriptions,
+                        'rejected_ids': rejected,
+                    }))
+            elif message_type == 'unsubscribe':
+                car_ids = data.get('car_ids')
+                if car_ids is None:
+                    car_ids = list(self.subscribed_ids)
+                await self.unsubscribe(self.parse_car_ids(car_ids))
+            else:
+                return
+
+            await self.send(text_data=json.dumps({
+                'type': 'subscriptions',
+                'car_ids': sorted(self.subscribed_ids),
+            }))
+        except Exception as e:
+            logger.error(f"Error in receive for auctions: {str(e)}")
+
+    async def subscribe(self, car_ids):
+        """Подписывает на лоты, возвращает id, не поместившиеся в max_subscriptions"""
+        # После первой подписки сокет больше не получает обновления всех лотов
+        if self.in_global_feed:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            self.in_global_feed = False
+
+        rejected = []
+        for car_id in car_ids:
+            if car_id in self.subscribed_ids:
+                continue
+            if len(self.subscribed_ids) >= self.max_subscriptions:
+                rejected.append(car_id)
+                continue
+            await self.channel_layer.group_add(f'auction_feed_{car_id}', self.channel_name)
+            self.subscribed_ids.add(car_id)
+        return rejected
+
+    async def unsubscribe(self, car_ids):
+        for car_id in car_ids:
+            if car_id in self.subscribed_ids:
+                await self.channel_layer.group_discard(f'auction_feed_{car_id}', self.channel_name)
+                self.subscribed_ids.discard(car_id)
+                self.pending_updates.pop(car_id, None)
+
+    def parse_car_ids(self, car_ids):
+        if not isinstance(car_ids, list):
+            return []
+        return [int(car_id) for car_id in car_ids if str(car_id).isdigit()]
+
+    @database_sync_to_async
+    def resolve_filter(self, params):
+        """
+        Возвращает id лотов страницы, которую клиент получил бы от CarFilterView
+        с теми же параметрами
+        """
+        from .filters import filter_cars
+        from .pagination import CarPagination, KeysetPagination
+
+        try:
+            page = max(int(params.get('page', 1)), 1)
+            page_size = min(int(params.get('page_size', CarPagination.page_size)), CarPagination.max_page_size)
+        except (TypeError, ValueError):
+            return []
+
+        queryset = filter_cars(Car.objects.all(), params)
+        if 'cursor' in params:
+            paginator = KeysetPagination()
+            try:
+                cursor = paginator.decode_cursor(params['cursor'])
+                page = paginator.get_page(queryset.only('id', 'created_at', 'current_price'), cursor, page_size)
+            except (TypeError, ValueError, ValidationError):
+                return []
+            return [car.id for car in page]
+
+        offset = (page - 1) * page_size
+        return list(queryset.values_list('id', flat=True)[offset:offset + page_size])
+
     async def auction_update(self, event):
+        # Более позднее обновление лота заменяет более раннее в пределах окна
+        update = self.pending_updates.setdefault(event['car_id'], {'car_id': event['car_id']})
+        for field in ('current_price', 'bid_count', 'status'):
+            if event.get(field) is not None:
+                update[field] = event[field]
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_updates())
+
+    async def flush_updates(self):
         try:
-            # Forward the auction update to WebSocket
-            await self.send(text_data=event['message'])
-            logger.debug("Sent auction update to all connected clients")
+            await asyncio.sleep(self.feed_window)
+            updates, self.pending_updates = self.pending_updates, {}
+            self.flush_task = None
+
+            await self.send(text_data=json.dumps({
+                'type': 'auction_updates',
+                'lots': list(updates.values()),
+            }))
+            logger.debug(f"Sent {len(updates)} coalesced auction updates")
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Error in auction_update: {str(e)}")
 
 
-class NotificationsConsumer(AsyncWebsocketConsumer):
+class NotificationsConsumer(OutboundQueueMixin, AsyncWebsocketConsumer):
     async def connect(self):
         try:
             self.user = self.scope.get('user', None)
@@ -181,16 +394,12 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
             
     async def notification_update(self, event):
         try:
-            # Отправляем уведомление пользователю
-            await self.send(text_data=event['message'])
+            # Отправляем уже закодированное уведомление пользователю как есть
+            await self.queue_send(event['message'])
             
-            # Извлекаем тип уведомления для логирования
-            try:
-                message_data = json.loads(event['message'])
-                notification_type = message_data.get('type', 'unknown')
-                logger.info(f"Sent {notification_type} notification to user {self.user.id if self.user else 'unknown'}")
-            except:
-                logger.info(f"Sent notification update to user {self.user.id if self.user else 'unknown'}")
+            # Тип уведомления передается отдельным полем события
+            notification_type = event.get('message_type', 'unknown')
+            logger.info(f"Sent {notification_type} notification to user {self.user.id if self.user else 'unknown'}")
         except Exception as e:
             logger.error(f"Error in notification_update: {str(e)}")
             
@@ -210,7 +419,7 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
             }
             
             # Отправляем уведомление клиенту
-            await self.send(text_data=json.dumps(message))
+            await self.queue_send(json.dumps(message))
             logger.info(f"Sent auction_won notification to user {event.get('user_id')}")
         except Exception as e:
             logger.error(f"Error in auction_won_notification: {str(e)}")
@@ -232,7 +441,7 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
             }
             
             # Отправляем уведомление клиенту
-            await self.send(text_data=json.dumps(message))
+            await self.queue_send(json.dumps(message))
             logger.info(f"Sent outbid_notification to user {self.user.id if self.user else 'unknown'}")
         except Exception as e:
             logger.error(f"Error in outbid_notification: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,214 @@
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.utils import timezone
+
+# Нижние границы ценовых диапазонов
+PRICE_BUCKETS = (0, 100000, 300000, 500000, 1000000, 2000000, 5000000)
+# Ширина диапазона годов выпуска
+YEAR_BUCKET = 5
+
+
+def price_bucket(price):
+    """Номер ценового диапазона для цены"""
+    return max(bisect_right(PRICE_BUCKETS, price or 0) - 1, 0)
+
+
+def year_bucket(year):
+    """Первый год пятилетнего диапазона"""
+    return year // YEAR_BUCKET * YEAR_BUCKET
+
+
+def facet_key(status, brand, year, price):
+    return (status, brand, year_bucket(year), price_bucket(price))
+
+
+def car_key(car):
+    return facet_key(car.status, car.brand, car.year, car.current_price)
+
+
+def apply_deltas(deltas):
+    """
+    Применяет изменения счетчиков {ключ фасетов: приращение} одним
+    INSERT ... ON CONFLICT DO UPDATE: новые сочетания создаются,
+    существующие счетчики увеличиваются на приращение
+    """
+    from .models import CarFacetCount
+
+    rows = [(*key, delta) for key, delta in deltas.items() if delta]
+    if not rows:
+        return
+
+    # bulk_create(update_conflicts=True) умеет только заменять значение,
+    # а не прибавлять к нему, поэтому запрос составляется вручную
+    qn = connection.ops.quote_name
+    table = qn(CarFacetCount._meta.db_table)
+    columns = [qn(CarFacetCount._meta.get_field(name).column)
+               for name in ('status', 'brand', 'year_bucket', 'price_bucket', 'count')]
+    count = columns[-1]
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}) '
+        f'VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))} '
+        f'ON CONFLICT ({", ".join(columns[:-1])}) '
+        f'DO UPDATE SET {count} = {table}.{count} + excluded.{count}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def move(old_key, new_key):
+    """Переносит один лот между сочетаниями фасетов (None - лота нет)"""
+    if old_key == new_key:
+        return
+    deltas = Counter()
+    if old_key is not None:
+        deltas[old_key] -= 1
+    if new_key is not None:
+        deltas[new_key] += 1
+    apply_deltas(deltas)
+
+
+def move_status(cars, old_status, new_status):
+    """
+    Переносит лоты, статус которых изменен одним UPDATE.
+    cars - словари с полями brand, year, current_price
+    """
+    deltas = Counter()
+    for car in cars:
+        deltas[facet_key(old_status, car['brand'], car['year'], car['current_price'])] -= 1
+        deltas[facet_key(new_status, car['brand'], car['year'], car['current_price'])] += 1
+    apply_deltas(deltas)
+
+
+def rebuild():
+    """Пересчитывает таблицу счетчиков по таблице лотов"""
+    from .models import Car, CarFacetCount
+
+    deltas = Counter()
+    for car in Car.objects.values('status', 'brand', 'year', 'current_price'):
+        deltas[facet_key(car['status'], car['brand'], car['year'], car['current_price'])] += 1
+
+    with transaction.atomic():
+        CarFacetCount.objects.all().delete()
+        CarFacetCount.objects.bulk_create([
+            CarFacetCount(status=status, brand=brand, year_bucket=year, price_bucket=price, count=count)
+            for (status, brand, year, price), count in deltas.items()
+        ])
+
+
+def _price_bucket_expression():
+    return Case(
+        *[When(current_price__gte=bound, then=Value(index))
+          for index, bound in reversed(list(enumerate(PRICE_BUCKETS)))],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def _bucket_bounds(params):
+    """
+    Возвращает диапазон номеров ценовых корзин для min_price/max_price
+    или None, если границы не совпадают с границами корзин
+    """
+    try:
+        min_price = Decimal(params['min_price']) if params.get('min_price') else None
+        max_price = Decimal(params['max_price']) if params.get('max_price') else None
+    except InvalidOperation:
+        return None
+
+    first, last = 0, len(PRICE_BUCKETS) - 1
+    if min_price is not None:
+        if min_price not in PRICE_BUCKETS:
+            return None
+        first = PRICE_BUCKETS.index(min_price)
+    if max_price is not None:
+        # max_price включительно: допустима граница следующей корзины минус копейка
+        upper = max_price + Decimal('0.01')
+        if upper not in PRICE_BUCKETS:
+            return None
+        last = PRICE_BUCKETS.index(upper) - 1
+    return first, last
+
+
+def facet_rows(params):
+    """
+    Строки (status, brand, year_bucket, price_bucket, count) для фильтра CarFilterView.
+    Фильтры по статусу, марке и ценовым корзинам отвечаются таблицей счетчиков,
+    остальные (поиск, рейтинг, произвольные границы цены) - одним GROUP BY по лотам
+    """
+    from .filters import filter_cars
+    from .models import Car, CarFacetCount
+
+    bounds = _bucket_bounds(params)
+    if bounds is None or params.get('search') or params.get('min_rating'):
+        queryset = filter_cars(Car.objects.all(), params).order_by()
+        return queryset.annotate(
+            year_bucket=F('year') / YEAR_BUCKET * YEAR_BUCKET,
+            price_bucket=_price_bucket_expression(),
+        ).values('status', 'brand', 'year_bucket', 'price_bucket').annotate(count=Count('id'))
+
+    counters = CarFacetCount.objects.filter(count__gt=0, price_bucket__range=bounds)
+    status = params.get('status') or 'active'
+    if status != 'all':
+        counters = counters.filter(status=status)
+    if params.get('brand'):
+        counters = counters.filter(brand__iexact=params['brand'])
+    rows = counters.values('status', 'brand', 'year_bucket', 'price_bucket', 'count')
+    if status != 'active':
+        return rows
+
+    # filter_cars не показывает активные лоты с истекшим end_time, которые
+    # планировщик еще не завершил: они вычитаются из счетчиков. Таких лотов
+    # немного, их выбирает индекс (status, end_time)
+    expired = Car.objects.filter(status='active', end_time__lte=timezone.now())
+    if params.get('brand'):
+        expired = expired.filter(brand__iexact=params['brand'])
+    expired = expired.order_by().annotate(
+        year_bucket=F('year') / YEAR_BUCKET * YEAR_BUCKET,
+        price_bucket=_price_bucket_expression(),
+    ).filter(price_bucket__range=bounds).values(
+        'status', 'brand', 'year_bucket', 'price_bucket'
+    ).annotate(count=Count('id'))
+
+    counts = Counter()
+    for row in rows:
+        counts[(row['status'], row['brand'], row['year_bucket'], row['price_bucket'])] += row['count']
+    for row in expired:
+        counts[(row['status'], row['brand'], row['year_bucket'], row['price_bucket'])] -= row['count']
+    return [
+        {'status': status, 'brand': brand, 'year_bucket': year, 'price_bucket': price, 'count': count}
+        for (status, brand, year, price), count in counts.items() if count > 0
+    ]
+
+
+def get_facets(params):
+    """Количество лотов по марке, диапазону годов, ценовому диапазону и статусу"""
+    facets = {name: Counter() for name in ('brand', 'year', 'price', 'status')}
+    total = 0
+    for row in facet_rows(params):
+        total += row['count']
+        facets['brand'][row['brand']] += row['count']
+        facets['year'][row['year_bucket']] += row['count']
+        facets['price'][row['price_bucket']] += row['count']
+        facets['status'][row['status']] += row['count']
+
+    def price_range(index):
+        upper = PRICE_BUCKETS[index + 1] if index + 1 < len(PRICE_BUCKETS) else None
+        return {'from': PRICE_BUCKETS[index], 'to': upper}
+
+    return {
+        'total': total,
+        'brand': [{'value': brand, 'count': count} for brand, count in facets['brand'].most_common()],
+        'year': [
+            {'from': year, 'to': year + YEAR_BUCKET - 1, 'count': count}
+            for year, count in sorted(facets['year'].items(), reverse=True)
+        ],
+        'price': [
+            {**price_range(index), 'count': count}
+            for index, count in sorted(facets['price'].items())
+        ],
+        'status': [{'value': status, 'count': count} for status, count in facets['status'].most_common()],
+    }
@@ -0,0 +1,72 @@
+from django.utils import timezone
+
+from .search import get_search_backend
+
+
+def filter_cars(queryset, params):
+    """
+    Применяет к выборке лотов фильтры и сортировку из параметров запроса
+    CarFilterView (min_price, max_price, brand, min_rating, search, sort, status)
+    """
+    # Filter by price range
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
+    if min_price:
+        queryset = queryset.filter(current_price__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(current_price__lte=max_price)
+
+    # Фильтрация по тегам и способам оплаты удалена
+
+    # Filter by brand
+    brand = params.get('brand')
+    if brand:
+        queryset = queryset.filter(brand__iexact=brand)
+
+    # Filter by seller loyalty/rating
+    min_rating = params.get('min_rating')
+    if min_rating:
+        queryset = queryset.filter(seller__profile__rating__gte=min_rating)
+
+    # Search by keyword in brand, model or description (поисковый индекс)
+    search = params.get('search')
+    if search:
+        queryset = get_search_backend().apply(queryset, search)
+
+    # Sort by price
+    sort = params.get('sort')
+    if sort == 'price_asc':
+        queryset = queryset.order_by('current_price')
+    elif sort == 'price_desc':
+        queryset = queryset.order_by('-current_price')
+    elif 'search_rank' in queryset.query.annotations:
+        # Без явной сортировки результаты поиска идут по релевантности
+        queryset = queryset.order_by('search_rank', '-created_at')
+    else:
+        # Default sort by created date (newest first)
+        queryset = queryset.order_by('-created_at')
+
+    # Filter by status
+    status_filter = params.get('status')
+    now = timezone.now()
+    
+    if status_filter:
+        if status_filter == 'active':
+            # For active auctions, also check if they are not expired
+            queryset = queryset.filter(status='active', end_time__gt=now)
+        elif status_filter == 'completed':
+            # Show completed auctions
+            queryset = queryset.filter(status='completed')
+        elif status_filter == 'cancelled':
+            # Show cancelled auctions
+            queryset = queryset.filter(status='cancelled')
+        elif status_filter == 'all':
+            # Show all auctions regardless of status
+            pass
+        else:
+            queryset = queryset.filter(status=status_filter)
+    else:
+        # Default to only active and non-expired auctions
+        queryset = queryset.filter(status='active', end_time__gt=now)
+
+    return queryset
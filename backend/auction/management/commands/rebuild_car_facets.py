@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from auction import facets
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики фасетов лотов'
+
+    def handle(self, *args, **options):
+        facets.rebuild()
+        self.stdout.write(self.style.SUCCESS('Счетчики фасетов пересчитаны'))
@@ -0,0 +1,96 @@
+import time
+import logging
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from config.channel_layers import LocalSocketChannelLayer
+
+from auction.models import Car
+from auction.timer_wheel import TimerWheel
+from auction.utils import complete_expired_auctions
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Планировщик завершения аукционов: завершает лоты в момент окончания по колесу таймеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=1.0,
+                            help='Длина тика колеса таймеров в секундах')
+        parser.add_argument('--refresh', type=float, default=30.0,
+                            help='Интервал сверки расписания с базой данных в секундах')
+
+    def handle(self, *args, **options):
+        self.check_shared_backends()
+
+        tick = options['tick']
+        refresh = options['refresh']
+
+        self.wheel = TimerWheel(time.time(), tick=tick)
+        self.stdout.write(self.style.SUCCESS('Планировщик аукционов запущен'))
+
+        next_refresh = 0
+        try:
+            while True:
+                now = time.time()
+                if now >= next_refresh:
+                    self.refresh_schedule()
+                    next_refresh = now + refresh
+
+                due = self.wheel.advance(now)
+                if due:
+                    self.complete(due)
+
+                time.sleep(tick)
+        except KeyboardInterrupt:
+            self.stdout.write('Планировщик аукционов остановлен')
+
+    def check_shared_backends(self):
+        """
+        Планировщик работает в отдельном процессе: уведомления о завершении
+        и сброс кэша ответов должны доходить до процессов Daphne
+        """
+        layer = get_channel_layer()
+        if isinstance(layer, InMemoryChannelLayer) and not isinstance(layer, LocalSocketChannelLayer):
+            raise CommandError(
+                'Слой каналов в памяти процесса не доставит уведомления о завершении аукционов '
+                'клиентам WebSocket. Используйте CHANNEL_LAYER=local_socket'
+            )
+        if isinstance(caches['default'], LocMemCache):
+            raise CommandError(
+                'Кэш в памяти процесса не будет сброшен при завершении аукционов. '
+                'Используйте CACHE_BACKEND=file'
+            )
+
+    def refresh_schedule(self):
+        """
+        Сверяет колесо таймеров с активными лотами: добавляет новые,
+        переносит измененные сроки и убирает завершенные или удаленные лоты
+        """
+        close_old_connections()
+        active = dict(Car.objects.filter(status='active').values_list('id', 'end_time'))
+
+        for car_id in self.wheel.keys():
+            if car_id not in active:
+                self.wheel.cancel(car_id)
+
+        for car_id, end_time in active.items():
+            self.wheel.schedule(car_id, end_time.timestamp())
+
+        logger.debug(f"Auction scheduler tracks {len(self.wheel)} active auctions")
+
+    def complete(self, car_ids):
+        try:
+            close_old_connections()
+            count = complete_expired_auctions(car_ids=car_ids)
+            if count:
+                self.stdout.write(f'{timezone.localtime():%H:%M:%S} завершено аукционов: {count}')
+        except Exception as e:
+            # Лоты остались активными и вернутся в колесо при следующей сверке
+            logger.exception(f"Error completing auctions {car_ids}: {str(e)}")
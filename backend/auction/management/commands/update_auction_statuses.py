@@ -1,36 +1,30 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from django.db import transaction
 from auction.models import Car
+from auction import facets
+from auction.cache import invalidate_cars
+from auction.utils import complete_expired_auctions
 
 class Command(BaseCommand):
     help = 'Update auction statuses based on start and end times'
 
     def handle(self, *args, **options):
         now = timezone.now()
-        activated_count = 0
-        completed_count = 0
         
-        # Activate pending auctions
-        pending_auctions = Car.objects.filter(
-            status='pending', 
-            start_time__lte=now
-        )
-        
-        for auction in pending_auctions:
-            auction.status = 'active'
-            auction.save(update_fields=['status'])
-            activated_count += 1
-        
-        # Complete active auctions that have ended
-        active_auctions = Car.objects.filter(
-            status='active', 
-            end_time__lte=now
-        )
+        # Activate pending auctions with a single UPDATE
+        with transaction.atomic():
+            pending = Car.objects.select_for_update().filter(
+                status='pending', 
+                start_time__lte=now
+            )
+            activated = list(pending.values('id', 'brand', 'year', 'current_price'))
+            activated_count = pending.update(status='active')
+            facets.move_status(activated, 'pending', 'active')
+            transaction.on_commit(lambda: invalidate_cars([car['id'] for car in activated], listings=True))
         
-        for auction in active_auctions:
-            auction.status = 'completed'
-            auction.save(update_fields=['status'])
-            completed_count += 1
+        # Complete active auctions that have ended (set-based)
+        completed_count = complete_expired_auctions()
         
         self.stdout.write(
             self.style.SUCCESS(
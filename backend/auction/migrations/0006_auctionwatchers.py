@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 07:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0005_remove_car_payment_methods_remove_car_tags_carimage_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuctionWatchers',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('process', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watchers', to='auction.car')),
+            ],
+            options={
+                'verbose_name_plural': 'Auction watchers',
+                'unique_together': {('process', 'car')},
+            },
+        ),
+    ]
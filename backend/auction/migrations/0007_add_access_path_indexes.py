@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0006_auctionwatchers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['car', '-amount'], name='auction_bid_car_id_b23705_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['car', '-created_at'], name='auction_bid_car_id_bea6bd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidder', '-created_at'], name='auction_bid_bidder__e1c09e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['status', 'end_time'], name='auction_car_status_d6a432_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['status', 'current_price'], name='auction_car_status_dd5c47_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['status', '-created_at'], name='auction_car_status_8cb404_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carimage',
+            index=models.Index(fields=['car', 'is_primary'], name='auction_car_car_id_19fbf9_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # Полнотекстовый индекс FTS5 используется только на SQLite
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS auction_car_fts "
+        "USING fts5(brand, model, description, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO auction_car_fts (rowid, brand, model, description) "
+        "SELECT id, brand, model, description FROM auction_car"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS auction_car_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0007_add_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 07:49
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def fill_facet_counts(apps, schema_editor):
+    from auction.facets import facet_key
+
+    Car = apps.get_model('auction', 'Car')
+    CarFacetCount = apps.get_model('auction', 'CarFacetCount')
+    counts = Counter(
+        facet_key(car['status'], car['brand'], car['year'], car['current_price'])
+        for car in Car.objects.values('status', 'brand', 'year', 'current_price')
+    )
+    CarFacetCount.objects.bulk_create([
+        CarFacetCount(status=status, brand=brand, year_bucket=year, price_bucket=price, count=count)
+        for (status, brand, year, price), count in counts.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0008_car_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('brand', models.CharField(max_length=100)),
+                ('year_bucket', models.PositiveIntegerField()),
+                ('price_bucket', models.PositiveIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('status', 'brand', 'year_bucket', 'price_bucket')},
+            },
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 08:22
+
+import auction.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0009_carfacetcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarSearchIndex',
+            fields=[
+                ('car', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='auction.car')),
+                ('brand', models.TextField()),
+                ('model', models.TextField()),
+                ('description', models.TextField()),
+                ('document', auction.search.SearchDocumentField(db_column='auction_car_fts')),
+            ],
+            options={
+                'db_table': 'auction_car_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0010_car_search_index_model'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bid',
+            name='auction_bid_bidder__e1c09e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='car',
+            name='auction_car_status_dd5c47_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='car',
+            name='auction_car_status_8cb404_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='carimage',
+            name='auction_car_car_id_19fbf9_idx',
+        ),
+        migrations.AddIndex(
+            model_name='carimage',
+            index=models.Index(fields=['car', '-is_primary', '-created_at'], name='auction_car_car_id_a63040_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0011_drop_unused_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='car',
+            name='status',
+            field=models.CharField(choices=[('active', 'Active'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='active', max_length=20),
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.conf import settings
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from .search import SearchDocumentField
+
 class Car(models.Model):
     STATUS_CHOICES = (
         ('active', 'Active'),
@@ -28,6 +30,9 @@ class Car(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'end_time']),
+        ]
     
     def __str__(self):
         return f"{self.brand} {self.model} ({self.year})"
@@ -64,6 +69,10 @@ class Bid(models.Model):
     
     class Meta:
         ordering = ['-amount']
+        indexes = [
+            models.Index(fields=['car', '-amount']),
+            models.Index(fields=['car', '-created_at']),
+        ]
     
     def __str__(self):
         return f"{self.bidder.username} bid ${self.amount} on {self.car}"
@@ -76,6 +85,9 @@ class CarImage(models.Model):
     
     class Meta:
         ordering = ['-is_primary', '-created_at']
+        indexes = [
+            models.Index(fields=['car', '-is_primary', '-created_at']),
+        ]
     
     def __str__(self):
         return f"Image for {self.car} {'(Primary)' if self.is_primary else ''}"
@@ -99,4 +111,60 @@ class AuctionHistory(models.Model):
     
     def __str__(self):
         winner_name = self.winner.username if self.winner else "No winner"
-        return f"{self.car} - Winner: {winner_name} - Final price: ${self.final_price}"
\ No newline at end of file
+        return f"{self.car} - Winner: {winner_name} - Final price: ${self.final_price}"
+
+class AuctionWatchers(models.Model):
+    """
+    Число WebSocket-зрителей лота в одном ASGI-процессе.
+    Каждый процесс периодически перезаписывает свои строки (auction.presence),
+    сумма свежих строк по лоту дает общее число зрителей
+    """
+    process = models.CharField(max_length=100)
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='watchers')
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('process', 'car')
+        verbose_name_plural = 'Auction watchers'
+
+    def __str__(self):
+        return f"{self.car} - {self.count} watchers ({self.process})"
+
+
+class CarFacetCount(models.Model):
+    """
+    Количество лотов по сочетанию значений фасетов (auction.facets).
+    Счетчики меняются при сохранении и удалении лота, ставке и завершении аукциона
+    """
+    status = models.CharField(max_length=20)
+    brand = models.CharField(max_length=100)
+    year_bucket = models.PositiveIntegerField()
+    price_bucket = models.PositiveIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('status', 'brand', 'year_bucket', 'price_bucket')
+
+    def __str__(self):
+        return f"{self.status} {self.brand} {self.year_bucket} {self.price_bucket}: {self.count}"
+
+
+class CarSearchIndex(models.Model):
+    """
+    Строка полнотекстового индекса лота: виртуальная таблица FTS5
+    auction_car_fts (rowid = id лота), создается миграцией только на SQLite.
+    Нужна, чтобы SQLiteFTSBackend присоединял индекс к выборке лотов
+    """
+    car = models.OneToOneField(
+        Car, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_index'
+    )
+    brand = models.TextField()
+    model = models.TextField()
+    description = models.TextField()
+    document = SearchDocumentField(db_column='auction_car_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'auction_car_fts'
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.db.models import Count
+
+from django.utils import timezone
+
+# Снимок состояния лота: текущая цена, статус, срок окончания,
+# лидирующая ставка и количество ставок
+LotState = namedtuple('LotState', [
+    'car_id', 'price', 'status', 'end_time', 'bid_count',
+    'top_bid_id', 'top_amount', 'top_bidder_id', 'top_bidder_username',
+])
+
+
+class OrderBook:
+    """
+    Внутрипроцессная книга ставок по лотам.
+
+    Хранит для каждого лота текущую цену, лидирующую ставку и количество ставок,
+    чтобы проверка ставки и поиск перебитого участника не требовали SQL.
+    Состояние загружается из таблицы Bid при первом обращении и обновляется
+    place_bid после фиксации транзакции. Книга может отставать от БД
+    (например, если ставку принял другой процесс), поэтому place_bid
+    использует цену из книги как условие UPDATE и перечитывает лот при расхождении.
+
+    Книга также служит снимком лота для AuctionConsumer при подключении:
+    путь ставок (record_bid) и путь завершения (record_completion) держат
+    её актуальной, а события других процессов сбрасывают устаревшие лоты
+    через observe. Аукционы завершает отдельный процесс, поэтому активный
+    лот с наступившим сроком окончания не считается актуальным и
+    перечитывается из БД.
+    """
+
+    def __init__(self, max_lots=1000):
+        self.max_lots = max_lots
+        self._lots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, car_id, price=None):
+        """
+        Возвращает состояние лота, при необходимости загружая его из БД.
+        Если передана известная текущая цена лота и она не совпадает
+        с ценой в книге, состояние перечитывается.
+        """
+        with self._lock:
+            state = self._lots.get(car_id)
+            if state is not None and (price is None or state.price == price) and is_current(state):
+                self._lots.move_to_end(car_id)
+                return state
+
+        state = self._load(car_id)
+        if state is not None:
+            self._store(state)
+        return state
+
+    def peek(self, car_id):
+        """Возвращает состояние лота из памяти без обращения к БД или None"""
+        with self._lock:
+            state = self._lots.get(car_id)
+            if state is None or not is_current(state):
+                return None
+            self._lots.move_to_end(car_id)
+            return state
+
+    def record_bid(self, bid):
+        """Применяет зафиксированную в БД ставку к состоянию лота"""
+        with self._lock:
+            state = self._lots.get(bid.car_id)
+            # Если лот не загружен или уже содержит эту ставку, ничего не делаем
+            if state is None or bid.amount <= state.price:
+                return
+            self._lots[bid.car_id] = state._replace(
+                price=bid.amount,
+                bid_count=state.bid_count + 1,
+                top_bid_id=bid.id,
+                top_amount=bid.amount,
+                top_bidder_id=bid.bidder_id,
+                top_bidder_username=bid.bidder.username,
+            )
+
+    def record_completion(self, car_ids):
+        """Отмечает завершенные лоты, зафиксированные в БД"""
+        with self._lock:
+            for car_id in car_ids:
+                state = self._lots.get(car_id)
+                if state is not None:
+                    self._lots[car_id] = state._replace(status='completed')
+
+    def observe(self, car_id, price=None, status=None):
+        """
+        Сверяет лот с событием из группы каналов: если событие новее книги
+        (например, ставку принял другой процесс), лот сбрасывается
+        """
+        with self._lock:
+            state = self._lots.get(car_id)
+            if state is None:
+                return
+            if (price is not None and state.price < price) or \
+                    (status is not None and state.status != status):
+                del self._lots[car_id]
+
+    def invalidate(self, car_id):
+        """Сбрасывает состояние лота, следующее обращение перечитает его из БД"""
+        with self._lock:
+            self._lots.pop(car_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._lots.clear()
+
+    def _store(self, state):
+        with self._lock:
+            self._lots[state.car_id] = state
+            self._lots.move_to_end(state.car_id)
+            while len(self._lots) > self.max_lots:
+                self._lots.popitem(last=False)
+
+    def _load(self, car_id):
+        from .models import Car, Bid
+
+        car = Car.objects.filter(pk=car_id).annotate(
+            bid_count=Count('bids')
+        ).values('current_price', 'status', 'end_time', 'bid_count').first()
+        if car is None:
+            return None
+
+        top_bid = Bid.objects.filter(car_id=car_id).select_related('bidder').order_by('-amount').first()
+        return LotState(
+            car_id=car_id,
+            price=car['current_price'],
+            status=car['status'],
+            end_time=car['end_time'],
+            bid_count=car['bid_count'],
+            top_bid_id=top_bid.id if top_bid else None,
+            top_amount=top_bid.amount if top_bid else None,
+            top_bidder_id=top_bid.bidder_id if top_bid else None,
+            top_bidder_username=top_bid.bidder.username if top_bid else None,
+        )
+
+
+def is_current(state):
+    """
+    Состояние лота можно использовать без сверки с БД: активный лот
+    с истекшим сроком мог быть уже завершен планировщиком
+    """
+    return state.status != 'active' or state.end_time > timezone.now()
+
+
+def time_remaining(state):
+    """Оставшееся время лота в секундах, как Car.time_remaining"""
+    if state.status != 'active':
+        return 0
+    now = timezone.now()
+    if now > state.end_time:
+        return 0
+    return int((state.end_time - now).total_seconds())
+
+
+order_book = OrderBook()
@@ -0,0 +1,191 @@
+import base64
+import functools
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import listing_generations
+
+# Время жизни приблизительного количества записей (count=approx), в секундах
+APPROXIMATE_COUNT_TTL = 60
+
+# Параметры запроса, от которых зависит состав выборки (auction.filters.filter_cars).
+# Версия увеличивается при изменении смысла фильтров, чтобы не читать старые количества
+COUNT_FILTER_PARAMS = ('min_price', 'max_price', 'brand', 'min_rating', 'search', 'status')
+COUNT_FILTER_VERSION = 1
+
+
+def approximate_count_key(queryset, request):
+    """
+    Ключ кэша количества записей: модель, путь запроса, нормализованные
+    параметры фильтров и поколения списков лотов. Параметры страницы,
+    сортировки и текущее время в ключ не входят, поэтому одинаковые
+    фильтры используют один COUNT(*) до изменения состава списков
+    """
+    params = {}
+    for name in COUNT_FILTER_PARAMS:
+        value = request.query_params.get(name, '').strip()
+        if value:
+            params[name] = value.lower() if name in ('brand', 'status') else value
+    raw = json.dumps([
+        COUNT_FILTER_VERSION,
+        queryset.model._meta.label,
+        request.path,
+        sorted(params.items()),
+        listing_generations(params),
+    ])
+    return 'approx_count:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def approximate_count(queryset, request):
+    """Количество записей выборки, закэшированное на APPROXIMATE_COUNT_TTL секунд"""
+    key = approximate_count_key(queryset, request)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, APPROXIMATE_COUNT_TTL)
+    return count
+
+
+def wants_approximate_count(request):
+    return request.query_params.get('count') == 'approx'
+
+
+class ApproximateCountPaginator(Paginator):
+    def __init__(self, object_list, per_page, request=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.request = request
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list, self.request)
+
+
+# Custom pagination for cars
+class CarPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # С count=approx общее количество берется из кэша, а не считается на каждой странице
+        if wants_approximate_count(request):
+            self.django_paginator_class = functools.partial(ApproximateCountPaginator, request=request)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по паре (поле сортировки, id).
+
+    Поле и направление берутся из первого поля сортировки выборки, id
+    сортируется в том же направлении и разрешает совпадения значений.
+    Следующая страница выбирается условием WHERE (field, id) после курсора
+    вместо OFFSET, поэтому время ответа не зависит от глубины страницы.
+    Курсор - значение последней записи страницы, закодированное в base64;
+    первая страница запрашивается с пустым cursor. Общее количество
+    не считается, с count=approx добавляется приблизительное.
+    """
+
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = approximate_count(queryset, request) if wants_approximate_count(request) else None
+
+        try:
+            cursor = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+            page = self.get_page(queryset, cursor, self.page_size)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound('Invalid cursor')
+
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_page(self, queryset, cursor, page_size):
+        """Возвращает записи после курсора (или с начала, если cursor None)"""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        field = ordering[0] if ordering else '-id'
+        descending = field.startswith('-')
+        self.field = field.lstrip('-')
+
+        if cursor is not None:
+            value, pk = cursor
+            # Значение курсора приводится к типу поля до построения фильтра
+            value = self.ordering_field(queryset).to_python(value)
+            after = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{after}': value}) |
+                Q(**{self.field: value, f'id__{after}': pk})
+            )
+
+        prefix = '-' if descending else ''
+        page = list(queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')[:page_size + 1])
+        self.has_next = len(page) > page_size
+        return page[:page_size]
+
+    def ordering_field(self, queryset):
+        """Поле модели или аннотация, по которой сортируется выборка"""
+        annotation = queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(self.field)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def encode_cursor(self, instance):
+        value = getattr(instance, self.field)
+        value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        return base64.urlsafe_b64encode(json.dumps([value, instance.pk]).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(pk)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
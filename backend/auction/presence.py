@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class WatcherCounter:
+    """
+    Счетчики зрителей лотов (сокетов AuctionConsumer) по группам auction_{id}.
+
+    Локальные счетчики процесса обновляются в connect/disconnect без запросов
+    к БД. Раз в sync_interval секунд процесс перезаписывает свои строки
+    в AuctionWatchers и читает счетчики остальных процессов; строки процессов,
+    не обновлявшихся дольше stale_after секунд, не учитываются. После сверки
+    изменившиеся общие числа рассылаются локальным зрителям лота кадром
+    auction_state с полем watchers.
+    """
+
+    def __init__(self, sync_interval=5.0, stale_after=30.0):
+        self.sync_interval = sync_interval
+        self.stale_after = stale_after
+        self.process_name = f'{socket.gethostname()}:{os.getpid()}'
+        self._consumers = {}
+        self._remote = {}
+        self._published = {}
+        self._task = None
+
+    def add(self, car_id, consumer):
+        self._consumers.setdefault(car_id, set()).add(consumer)
+        if self._task is None or self._task.done() or \
+                self._task.get_loop() is not asyncio.get_running_loop():
+            self._task = asyncio.ensure_future(self._run())
+
+    def remove(self, car_id, consumer):
+        consumers = self._consumers.get(car_id)
+        if consumers is None:
+            return
+        consumers.discard(consumer)
+        if not consumers:
+            del self._consumers[car_id]
+
+    def count(self, car_id):
+        """Число зрителей лота: свои сокеты плюс последние известные чужие"""
+        return len(self._consumers.get(car_id, ())) + self._remote.get(car_id, 0)
+
+    def local_counts(self):
+        return {car_id: len(consumers) for car_id, consumers in self._consumers.items()}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            local = self.local_counts()
+            try:
+                self._remote = await database_sync_to_async(self.sync)(local)
+            except Exception as e:
+                logger.exception(f"Error syncing auction watchers: {str(e)}")
+                continue
+            await self._publish()
+            # Строки процесса уже удалены, пока зрителей нет - сверка не нужна
+            if not local and not self._consumers:
+                self._task = None
+                return
+
+    def sync(self, local):
+        """Записывает счетчики процесса и возвращает счетчики остальных процессов"""
+        from .models import AuctionWatchers
+
+        now = timezone.now()
+        with transaction.atomic():
+            AuctionWatchers.objects.filter(process=self.process_name).delete()
+            AuctionWatchers.objects.bulk_create([
+                AuctionWatchers(process=self.process_name, car_id=car_id, count=count, updated_at=now)
+                for car_id, count in local.items()
+            ], ignore_conflicts=True)
+
+        rows = AuctionWatchers.objects.filter(
+            updated_at__gte=now - timedelta(seconds=self.stale_after)
+        ).exclude(
+            process=self.process_name
+        ).values('car_id').annotate(total=Sum('count'))
+        return {row['car_id']: row['total'] for row in rows}
+
+    async def _publish(self):
+        for car_id, consumers in list(self._consumers.items()):
+            watchers = self.count(car_id)
+            if self._published.get(car_id) == watchers:
+                continue
+            self._published[car_id] = watchers
+            # Кадр кодируется один раз для всех зрителей лота
+            text_data = json.dumps({
+                'type': 'auction_state',
+                'car_id': car_id,
+                'watchers': watchers,
+            })
+            for consumer in list(consumers):
+                try:
+                    await consumer.queue_send(text_data, droppable=True, key='watchers')
+                except Exception as e:
+                    logger.debug(f"Error sending watchers to auction {car_id}: {str(e)}")
+        for car_id in list(self._published):
+            if car_id not in self._consumers:
+                del self._published[car_id]
+
+
+def watcher_totals(car_ids=None, limit=None, stale_after=None):
+    """
+    Общее число зрителей по лотам для всех процессов, по убыванию
+    """
+    from .models import AuctionWatchers
+
+    stale_after = stale_after or watchers.stale_after
+    rows = AuctionWatchers.objects.filter(
+        updated_at__gte=timezone.now() - timedelta(seconds=stale_after)
+    )
+    if car_ids is not None:
+        rows = rows.filter(car_id__in=car_ids)
+    rows = rows.values('car_id').annotate(watchers=Sum('count')).order_by('-watchers', 'car_id')
+    if limit:
+        rows = rows[:limit]
+    return list(rows)
+
+
+watchers = WatcherCounter()
@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict, deque
+
+
+class BidReplayBuffer:
+    """
+    Кольцевые буферы последних событий bid_update по лотам.
+
+    Событию ставки присваивается порядковый номер seq - номер ставки
+    в лоте (bid_count после неё), поэтому номера идут подряд без пропусков.
+    Буфер хранит уже закодированные кадры и всегда содержит непрерывный
+    диапазон номеров: при пропуске (процесс не получил часть событий)
+    он начинается заново. Клиент, переподключившийся с last_seq, получает
+    недостающие кадры из буфера, если они в нём есть.
+    """
+
+    def __init__(self, size=50, max_lots=1000):
+        self.size = size
+        self.max_lots = max_lots
+        self._lots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, car_id, seq, message):
+        with self._lock:
+            events = self._lots.get(car_id)
+            if events is None:
+                events = self._lots[car_id] = deque(maxlen=self.size)
+                while len(self._lots) > self.max_lots:
+                    self._lots.popitem(last=False)
+            elif events and seq <= events[-1][0]:
+                # Событие уже записано (его получил другой сокет процесса)
+                return
+            elif events and seq != events[-1][0] + 1:
+                events.clear()
+            events.append((seq, message))
+            self._lots.move_to_end(car_id)
+
+    def since(self, car_id, last_seq, current_seq):
+        """
+        Возвращает кадры с номерами от last_seq + 1 до current_seq
+        или None, если буфер не покрывает этот диапазон
+        """
+        if last_seq >= current_seq:
+            return []
+        with self._lock:
+            events = self._lots.get(car_id)
+            if not events or events[0][0] > last_seq + 1 or events[-1][0] < current_seq:
+                return None
+            return [message for seq, message in events if last_seq < seq <= current_seq]
+
+    def invalidate(self, car_id):
+        with self._lock:
+            self._lots.pop(car_id, None)
+
+
+bid_history = BidReplayBuffer()
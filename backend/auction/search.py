@@ -0,0 +1,157 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Func, Lookup, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# Поля лота, по которым выполняется поиск
+SEARCH_FIELDS = ('brand', 'model', 'description')
+
+
+class SearchDocumentField(TextField):
+    """
+    Скрытый столбец FTS5 с именем таблицы (модель CarSearchIndex).
+    Условие document__match=... записывается как "<алиас>"."<таблица>" MATCH %s,
+    и его же принимают вспомогательные функции FTS5 (bm25)
+    """
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class SearchBackend:
+    """
+    Интерфейс поискового индекса лотов.
+
+    matching(query) возвращает выражение для фильтра id__in,
+    rank(query) - выражение релевантности (меньше - лучше) или None,
+    если бэкенд не ранжирует результаты. index/remove вызываются
+    сигналами Car, rebuild - командой rebuild_search_index.
+    """
+
+    def matching(self, query):
+        raise NotImplementedError
+
+    def rank(self, query):
+        return None
+
+    def apply(self, queryset, query):
+        """Оставляет в выборке найденные лоты и добавляет поле search_rank"""
+        queryset = queryset.filter(id__in=self.matching(query))
+        rank = self.rank(query)
+        if rank is not None:
+            queryset = queryset.annotate(search_rank=rank)
+        return queryset
+
+    def index(self, car):
+        pass
+
+    def remove(self, car_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class IContainsBackend(SearchBackend):
+    """Поиск подстроки через icontains без отдельного индекса"""
+
+    def matching(self, query):
+        from .models import Car
+
+        return Car.objects.filter(
+            Q(brand__icontains=query) |
+            Q(model__icontains=query) |
+            Q(description__icontains=query)
+        ).values('id')
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """
+    Полнотекстовый индекс SQLite FTS5 (таблица auction_car_fts, rowid = id лота).
+
+    Каждое слово запроса ищется как префикс, поэтому поиск работает
+    по мере ввода. Результаты ранжируются bm25, совпадения в марке
+    и модели весят больше, чем в описании. Таблица индекса присоединяется
+    к выборке лотов (CarSearchIndex), поэтому MATCH выполняется один раз
+    на запрос, а bm25 считается для строк этого же соединения.
+    """
+
+    table = 'auction_car_fts'
+    weights = (10.0, 10.0, 1.0)
+
+    def match_expression(self, query):
+        words = re.findall(r'\w+', query)
+        return ' '.join('"%s"*' % word for word in words)
+
+    def matching(self, query):
+        return RawSQL(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s',
+            (self.match_expression(query) or '""',)
+        )
+
+    def rank(self, query):
+        # Вычисляется по присоединенной в apply строке индекса
+        return Func(
+            F('search_index__document'),
+            *(Value(weight) for weight in self.weights),
+            function='bm25',
+            output_field=FloatField()
+        )
+
+    def apply(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        return queryset.filter(search_index__document__match=expression).annotate(
+            search_rank=self.rank(query)
+        )
+
+    def index(self, car):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [car.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, brand, model, description) VALUES (%s, %s, %s, %s)',
+                [car.pk, car.brand, car.model, car.description or '']
+            )
+
+    def remove(self, car_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [car_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, brand, model, description) '
+                f'SELECT id, brand, model, description FROM auction_car'
+            )
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Возвращает бэкенд из настройки AUCTION_SEARCH_BACKEND (путь к классу).
+    По умолчанию на SQLite используется FTS5, на остальных СУБД - icontains
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'AUCTION_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = IContainsBackend()
+    return _backend
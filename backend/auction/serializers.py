@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Car, Bid, AuctionHistory, CarImage
+from .order_book import order_book
 from users.serializers import UserSerializer
 from django.utils import timezone
 from django.conf import settings
@@ -29,6 +30,17 @@ def get_media_absolute_url(url):
     # В иных случаях добавляем / в начало
     return f"/{url}"
 
+def get_primary_car_image(car):
+    """
+    Возвращает основное изображение лота (или первое, если основного нет).
+    Использует изображения, предзагруженные в primary_images, если они есть.
+    """
+    images = getattr(car, 'primary_images', None)
+    if images is None:
+        # Порядок CarImage: сначала основное, затем самое новое
+        images = car.images.all()[:1]
+    return images[0] if images else None
+
 class CarImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
     
@@ -69,8 +81,8 @@ class BidSerializer(serializers.ModelSerializer):
             
         # Проверяем, не пытается ли пользователь перебить свою последнюю ставку
         if request:
-            latest_bid = Bid.objects.filter(car=car).order_by('-created_at').first()
-            if latest_bid and latest_bid.bidder == request.user:
+            lot = order_book.get(car.id, car.current_price)
+            if lot and lot.top_bidder_id == request.user.id:
                 raise serializers.ValidationError({"error": "Вы не можете перебить свою собственную ставку"})
         
         amount = data.get('amount')
@@ -120,20 +132,55 @@ class CarListSerializer(serializers.ModelSerializer):
         ]
     
     def get_bid_count(self, obj):
-        return obj.bids.count()
+        # Списочные представления аннотируют bid_count одним запросом
+        bid_count = getattr(obj, 'bid_count', None)
+        if bid_count is None:
+            bid_count = obj.bids.count()
+        return bid_count
     
     def get_time_remaining(self, obj):
         return obj.time_remaining()
         
     def get_image_url(self, obj):
-        if obj.image:
+        image = obj.image
+        if not image:
+            # Для новых лотов изображения хранятся в CarImage
+            primary_image = get_primary_car_image(obj)
+            image = primary_image.image if primary_image else None
+        if image:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.image.url)
+                return request.build_absolute_uri(image.url)
             # Используем helper функцию если нет request
-            return get_media_absolute_url(obj.image.url)
+            return get_media_absolute_url(image.url)
         return None
 
+class CarCardSerializer(CarListSerializer):
+    """
+    Компактное представление лота для карточек в списках: без ставок,
+    галереи и вложенного профиля продавца
+    """
+    seller = serializers.SerializerMethodField()
+    primary_image_url = serializers.SerializerMethodField()
+
+    class Meta(CarListSerializer.Meta):
+        fields = CarListSerializer.Meta.fields + ['primary_image_url']
+
+    def get_seller(self, obj):
+        return {
+            'id': obj.seller_id,
+            'username': obj.seller.username
+        }
+
+    def get_primary_image_url(self, obj):
+        primary_image = get_primary_car_image(obj)
+        if not primary_image:
+            return None
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(primary_image.image.url)
+        return get_media_absolute_url(primary_image.image.url)
+
 class CarDetailSerializer(serializers.ModelSerializer):
     seller = UserSerializer(read_only=True)
     bids = BidSerializer(many=True, read_only=True)
@@ -165,12 +212,8 @@ class CarDetailSerializer(serializers.ModelSerializer):
         return None
         
     def get_primary_image(self, obj):
-        # Находим основное изображение
-        primary_image = obj.images.filter(is_primary=True).first()
-        
-        # Если основного изображения нет, берем первое
-        if not primary_image:
-            primary_image = obj.images.first()
+        # Находим основное изображение, если основного нет - берем первое
+        primary_image = get_primary_car_image(obj)
             
         if primary_image:
             serializer = CarImageSerializer(primary_image, context=self.context)
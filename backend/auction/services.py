@@ -0,0 +1,179 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Car, Bid
+from .order_book import order_book
+from .replay import bid_history
+from . import facets
+from .cache import invalidate_cars
+from .utils import encode_event
+
+logger = logging.getLogger(__name__)
+
+
+def place_bid(car, bidder, amount):
+    """
+    Атомарно принимает ставку на лот.
+
+    Все проверки (аукцион активен, ставка не от продавца, сумма не меньше
+    current_price + min_bid_increment) выполняются одним условным UPDATE,
+    поэтому две одновременные ставки не могут пройти проверку по устаревшей цене.
+    Цена из книги ставок входит в условие UPDATE: если UPDATE прошёл, книга
+    актуальна и по ней можно определить предыдущего лидера без запросов.
+    """
+    price = car.current_price
+    for _ in range(2):
+        previous = order_book.get(car.pk, price)
+        if previous is None:
+            raise ValidationError({'error': 'Car not found'})
+
+        with transaction.atomic():
+            updated = Car.objects.filter(
+                pk=car.pk,
+                status='active',
+                end_time__gte=timezone.now(),
+                current_price=previous.price,
+                current_price__lte=amount - F('min_bid_increment'),
+            ).exclude(
+                seller=bidder
+            ).update(current_price=amount)
+
+            if updated:
+                # Откат UPDATE, если пользователь перебивает свою же ставку
+                if previous.top_bidder_id == bidder.id:
+                    raise ValidationError({"error": "Вы не можете перебить свою собственную ставку"})
+
+                bid = Bid.objects.create(car=car, bidder=bidder, amount=amount)
+                car.current_price = amount
+
+                # Счетчики фасетов меняются, только если цена перешла в другой диапазон
+                facets.move(
+                    facets.facet_key('active', car.brand, car.year, previous.price),
+                    facets.facet_key('active', car.brand, car.year, amount)
+                )
+
+                transaction.on_commit(lambda: order_book.record_bid(bid))
+                transaction.on_commit(lambda: invalidate_cars([car.pk], prices=True))
+                transaction.on_commit(lambda: _broadcast_bid(car, bid, previous))
+                return bid
+
+        # Ставка отклонена либо книга устарела: проверяем по свежим данным
+        _check_rejection(car.pk, bidder, amount)
+        order_book.invalidate(car.pk)
+        price = None
+
+    raise ValidationError({'error': 'Failed to place bid'})
+
+
+def _check_rejection(car_id, bidder, amount):
+    """
+    Определяет, почему условный UPDATE не затронул лот, и поднимает
+    ValidationError с тем же текстом, что и BidSerializer.validate.
+    Если по свежим данным ставка допустима, значит устарела книга ставок.
+    """
+    try:
+        car = Car.objects.get(pk=car_id)
+    except Car.DoesNotExist:
+        raise ValidationError({'error': 'Car not found'})
+
+    if not car.is_active():
+        raise ValidationError({"error": "Этот аукцион не активен или уже завершен"})
+
+    if car.seller_id == bidder.id:
+        raise ValidationError({"error": "Вы не можете делать ставки на свой собственный аукцион"})
+
+    min_increment = car.min_bid_increment
+    min_required = car.current_price + min_increment
+    if amount < min_required:
+        raise ValidationError({
+            "error": f"Ставка должна быть не менее {min_required} (текущая цена + {min_increment})"
+        })
+
+
+def _broadcast_bid(car, bid, previous):
+    """
+    Рассылает обновление ставки зрителям лота и уведомление о перебитой ставке
+    """
+    channel_layer = get_channel_layer()
+    bidder = bid.bidder
+    # Порядковый номер ставки в лоте, по нему клиенты догоняют пропущенные ставки
+    seq = previous.bid_count + 1
+
+    # Подготовка данных для отправки через WebSocket
+    bid_data = {
+        'type': 'bid_update',
+        'seq': seq,
+        'bid': {
+            'id': bid.id,
+            'amount': float(bid.amount),
+            'created_at': bid.created_at.isoformat(),
+            'bidder': {
+                'id': bidder.id,
+                'username': bidder.username
+            }
+        },
+        'car_id': car.id,
+        'current_price': float(car.current_price),
+    }
+
+    event = encode_event('bid_update', bid_data, current_price=str(car.current_price), seq=seq)
+    bid_history.record(car.id, seq, event['message'])
+
+    try:
+        async_to_sync(channel_layer.group_send)(f"auction_{car.id}", event)
+
+        # Изменение цены для общей ленты лотов (объединяется в AuctionsConsumer):
+        # сокетам без подписок и подписанным на этот лот
+        feed_update = {
+            'type': 'auction_update',
+            'car_id': car.id,
+            'current_price': float(car.current_price),
+            'bid_count': previous.bid_count + 1,
+            'status': 'active',
+        }
+        for group in ('auctions', f'auction_feed_{car.id}'):
+            async_to_sync(channel_layer.group_send)(group, feed_update)
+
+        # Уведомляем предыдущего лидера, если его ставку перебил другой пользователь
+        if not previous.top_bidder_id or previous.top_bidder_id == bidder.id:
+            return
+
+        previous_bidder_id = previous.top_bidder_id
+        async_to_sync(channel_layer.group_send)(
+            f"notifications_{previous_bidder_id}",
+            encode_event('notification_update', {
+                'type': 'outbid',
+                'user_id': previous_bidder_id,
+                'car_id': car.id,
+                'car_brand': car.brand,
+                'car_model': car.model,
+                'amount': float(bid.amount),
+                'previous_amount': float(previous.top_amount),
+                'new_amount': float(bid.amount),
+                'bidder_id': bidder.id,
+                'bidder_username': bidder.username,
+                'timestamp': timezone.now().isoformat(),
+            })
+        )
+
+        # Также отправляем в канал чат-уведомлений
+        async_to_sync(channel_layer.group_send)(
+            f"user_{previous_bidder_id}",
+            {
+                'type': 'auction_outbid_notification',
+                'user_id': previous_bidder_id,
+                'car_id': car.id,
+                'car_brand': car.brand,
+                'car_model': car.model,
+                'new_bid_amount': float(bid.amount)
+            }
+        )
+    except Exception as e:
+        # Ставка уже зафиксирована, ошибка рассылки не должна её откатывать
+        logger.exception(f"Error broadcasting bid {bid.id}: {str(e)}")
@@ -1,52 +1,133 @@
-from django.db.models.signals import post_save
+from django.contrib.auth import get_user_model
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Bid, Car, AuctionHistory
+from users.models import Profile
+from .models import Bid, Car, CarImage, AuctionHistory
+from .order_book import order_book
+from .replay import bid_history
+from .search import get_search_backend, SEARCH_FIELDS
+from . import facets
+from .cache import invalidate_cars
+from django.db import transaction
+from .utils import encode_event
 from django.utils import timezone
 from django.db.models import Max
 
-@receiver(post_save, sender=Bid)
-def bid_created(sender, instance, created, **kwargs):
+User = get_user_model()
+
+# Обновление current_price и уведомление о перебитой ставке выполняются
+# в auction.services.place_bid вместе с созданием ставки
+
+# Поля пользователя и профиля, которые входят в карточку лота (UserSerializer
+# продавца и участников торгов)
+CARD_FIELDS = {
+    User: ('username', 'email', 'first_name', 'last_name', 'is_email_verified'),
+    Profile: ('bio', 'phone', 'rating', 'rating_count', 'avatar'),
+}
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+@receiver(post_delete, sender=Bid)
+def invalidate_order_book(sender, instance, **kwargs):
     """
-    Signal to handle actions when a new bid is created
+    Сбрасывает книгу ставок лота при изменениях в обход place_bid
     """
-    if created:
-        # Update the current price of the car
-        car = instance.car
-        car.current_price = instance.amount
-        car.save(update_fields=['current_price'])
-        
-        # Найти предыдущую максимальную ставку (если есть) для уведомления пользователя
-        previous_bid = Bid.objects.filter(car=car).exclude(id=instance.id).order_by('-amount').first()
-        
-        # Если есть предыдущая ставка, отправляем уведомление ее создателю
-        if previous_bid and previous_bid.bidder.id != instance.bidder.id:
-            from channels.layers import get_channel_layer
-            from asgiref.sync import async_to_sync
-            import json
-            
-            channel_layer = get_channel_layer()
-            
-            # Данные для уведомления о перебитой ставке
-            outbid_notification = {
-                'type': 'outbid_notification',
-                'car_id': car.id, 
-                'car_brand': car.brand,
-                'car_model': car.model,
-                'previous_amount': float(previous_bid.amount),
-                'new_amount': float(instance.amount),
-                'bidder_id': instance.bidder.id,
-                'bidder_username': instance.bidder.username,
-                'timestamp': timezone.now().isoformat()
-            }
-            
-            # Отправка уведомления через канал уведомлений
-            async_to_sync(channel_layer.group_send)(
-                f"notifications_{previous_bid.bidder.id}",
-                {
-                    'type': 'notification_update',
-                    'message': json.dumps(outbid_notification)
-                }
-            )
+    car_id = instance.car_id if sender is Bid else instance.pk
+    order_book.invalidate(car_id)
+    # Удаление ставок сбивает нумерацию событий лота
+    if kwargs.get('signal') is post_delete:
+        bid_history.invalidate(car_id)
+
+@receiver(post_save, sender=Car)
+def index_car(sender, instance, update_fields=None, **kwargs):
+    """
+    Обновляет лот в поисковом индексе, если изменились поля поиска
+    """
+    if update_fields and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    get_search_backend().index(instance)
+
+@receiver(post_delete, sender=Car)
+def unindex_car(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+@receiver(post_save, sender=CarImage)
+@receiver(post_delete, sender=CarImage)
+def invalidate_car_responses(sender, instance, **kwargs):
+    """
+    Сбрасывает закэшированные ответы с лотом после фиксации изменений.
+    Изменение самого лота может менять состав списков, фото - только его карточку
+    """
+    car_id = instance.car_id if sender is CarImage else instance.pk
+    listings = sender is Car
+    transaction.on_commit(lambda: invalidate_cars([car_id], listings=listings))
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Profile)
+def remember_card_data_change(sender, instance, update_fields=None, **kwargs):
+    """
+    Запоминает, меняет ли сохранение данные пользователя, показанные в карточках
+    лотов (сохранение last_login или профиля без изменений их не меняет)
+    """
+    fields = [
+        field for field in CARD_FIELDS[sender]
+        if update_fields is None or field in update_fields
+    ]
+    instance._card_data_changed = False
+    if instance.pk and fields:
+        old = sender.objects.filter(pk=instance.pk).values(*fields).first()
+        instance._card_data_changed = old is not None and _fields_changed(instance, old, fields)
+
+def _fields_changed(instance, old, fields):
+    for field in fields:
+        value, stored = getattr(instance, field), old[field]
+        if isinstance(value, FieldFile):
+            # Отсутствующий файл хранится в БД как пустая строка или NULL
+            value, stored = value.name or '', stored or ''
+        if value != stored:
+            return True
+    return False
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Profile)
+def invalidate_user_car_responses(sender, instance, **kwargs):
+    """
+    Сбрасывает закэшированные карточки лотов пользователя и лотов с его ставками
+    после изменения его данных
+    """
+    if not getattr(instance, '_card_data_changed', False):
+        return
+    user_id = instance.pk if sender is User else instance.user_id
+
+    def invalidate():
+        car_ids = set(Car.objects.filter(seller_id=user_id).values_list('id', flat=True))
+        car_ids.update(Bid.objects.filter(bidder_id=user_id).values_list('car_id', flat=True))
+        if car_ids:
+            invalidate_cars(car_ids)
+
+    transaction.on_commit(invalidate)
+
+@receiver(pre_save, sender=Car)
+def remember_facet_key(sender, instance, **kwargs):
+    """
+    Запоминает сочетание фасетов лота до сохранения
+    """
+    instance._facet_key = None
+    if instance.pk:
+        old = Car.objects.filter(pk=instance.pk).values('status', 'brand', 'year', 'current_price').first()
+        if old:
+            instance._facet_key = facets.facet_key(old['status'], old['brand'], old['year'], old['current_price'])
+
+@receiver(post_save, sender=Car)
+def update_facet_counts(sender, instance, **kwargs):
+    facets.move(getattr(instance, '_facet_key', None), facets.car_key(instance))
+
+@receiver(post_delete, sender=Car)
+def remove_facet_counts(sender, instance, **kwargs):
+    facets.move(facets.car_key(instance), None)
 
 @receiver(post_save, sender=Car)
 def car_status_changed(sender, instance, **kwargs):
@@ -74,7 +155,6 @@ def car_status_changed(sender, instance, **kwargs):
             if highest_bid and highest_bid.bidder:
                 from channels.layers import get_channel_layer
                 from asgiref.sync import async_to_sync
-                import json
                 
                 winner = highest_bid.bidder
                 channel_layer = get_channel_layer()
@@ -94,10 +174,7 @@ def car_status_changed(sender, instance, **kwargs):
                 # Отправка уведомления через WebSocket
                 async_to_sync(channel_layer.group_send)(
                     f"notifications_{winner.id}",
-                    {
-                        'type': 'notification_update',
-                        'message': json.dumps(notification_data)
-                    }
+                    encode_event('notification_update', notification_data)
                 )
                 
                 # Также отправляем в канал чат-уведомлений
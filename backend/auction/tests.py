@@ -0,0 +1,337 @@
+import base64
+import json
+import threading
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .facets import get_facets
+from .filters import filter_cars
+from .models import Bid, Car, CarImage
+from .order_book import order_book
+from .search import SQLiteFTSBackend, get_search_backend
+from .services import place_bid
+from .views import with_listing_data
+
+User = get_user_model()
+
+
+def create_cars(seller, count, **fields):
+    """Создает count активных лотов продавца"""
+    end_time = timezone.now() + timedelta(days=1)
+    return [
+        Car.objects.create(
+            seller=seller,
+            brand='BMW',
+            model=f'X{index}',
+            year=2020,
+            description='Тестовый лот',
+            starting_price=1000,
+            current_price=1000,
+            end_time=end_time,
+            **fields
+        )
+        for index in range(count)
+    ]
+
+
+class ListingQueryPlanTests(TestCase):
+    """Планы запросов страниц списка лотов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+        for car in create_cars(cls.seller, 3):
+            Bid.objects.create(car=car, bidder=cls.bidder, amount=1100)
+
+    def test_bid_count_is_counted_per_row(self):
+        car = Car.objects.first()
+        Bid.objects.create(car=car, bidder=self.bidder, amount=1200)
+        counts = dict(with_listing_data(Car.objects.all()).values_list('id', 'bid_count'))
+        self.assertEqual(counts[car.id], 2)
+        self.assertEqual(sorted(counts.values()), [1, 1, 2])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'план запроса SQLite')
+    def test_listing_page_has_no_group_by(self):
+        querysets = {
+            'CarListCreateView': with_listing_data(
+                Car.objects.filter(status__in=['active', 'pending'])
+            ).order_by('-created_at'),
+            'CarFilterView': filter_cars(with_listing_data(Car.objects.all()), {}),
+        }
+        for name, queryset in querysets.items():
+            with self.subTest(view=name):
+                plan = queryset[:11].explain()
+                self.assertNotIn('GROUP BY', plan)
+                self.assertIn('CORRELATED SCALAR SUBQUERY', plan)
+                # Ставки лота считаются по индексу, без чтения строк таблицы
+                self.assertRegex(plan, r'SEARCH U0 USING COVERING INDEX \S+ \(car_id=\?\)')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'план запроса SQLite')
+class AccessPathIndexTests(TestCase):
+    """Составные индексы лотов, ставок и изображений используются своими запросами"""
+
+    def index_name(self, model, fields):
+        return next(index.name for index in model._meta.indexes if index.fields == fields)
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def test_listing_filters_by_status_and_end_time(self):
+        index = self.index_name(Car, ['status', 'end_time'])
+        for sort in ('', 'price_asc', 'price_desc'):
+            with self.subTest(sort=sort):
+                plan = filter_cars(with_listing_data(Car.objects.all()), {'sort': sort})[:11].explain()
+                self.assertIn(f'USING INDEX {index} (status=? AND end_time>?)', plan)
+
+    def test_expired_auctions_use_status_end_time(self):
+        plan = Car.objects.filter(status='active', end_time__lte=timezone.now()).explain()
+        self.assertIn(f"USING INDEX {self.index_name(Car, ['status', 'end_time'])} (status=? AND end_time<?)", plan)
+
+    def test_top_bid_uses_car_amount(self):
+        plan = Bid.objects.filter(car_id=1).order_by('-amount')[:1].explain()
+        self.assertIn(f"USING INDEX {self.index_name(Bid, ['car', '-amount'])} (car_id=?)", plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_lot_bids_by_date_use_car_created_at(self):
+        # Ставки лота в панели администратора, новые первыми
+        plan = Bid.objects.filter(car_id=1).order_by('-created_at')[:20].explain()
+        self.assertIn(f"USING INDEX {self.index_name(Bid, ['car', '-created_at'])} (car_id=?)", plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_primary_image_prefetch_uses_image_order(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        create_cars(seller, 2)
+        with CaptureQueriesContext(connection) as queries:
+            list(with_listing_data(Car.objects.all()))
+        prefetch = queries.captured_queries[-1]['sql']
+        plan = self.explain(prefetch)
+        index = self.index_name(CarImage, ['car', '-is_primary', '-created_at'])
+        self.assertIn(f'USING INDEX {index} (car_id=?)', plan)
+        # Изображения лота выбираются в порядке индекса, без сортировки внутри лота
+        self.assertNotIn('RIGHT PART OF ORDER BY', plan)
+
+
+@unittest.skipUnless(isinstance(get_search_backend(), SQLiteFTSBackend), 'поиск через FTS5')
+class FullTextSearchTests(TestCase):
+    """Поиск лотов по индексу FTS5"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.bmw, cls.audi, cls.kia = create_cars(seller, 3)
+        cls.audi.brand, cls.audi.description = 'Audi', 'Надежнее, чем BMW'
+        cls.audi.save()
+        cls.kia.brand = 'Kia'
+        cls.kia.save()
+
+    def test_brand_match_ranks_first(self):
+        queryset = filter_cars(with_listing_data(Car.objects.all()), {'search': 'bm'})
+        self.assertEqual(list(queryset.values_list('id', flat=True)), [self.bmw.id, self.audi.id])
+
+    def test_match_runs_once_per_query(self):
+        # Индекс присоединяется к лотам, MATCH не повторяется для каждой строки
+        queryset = filter_cars(with_listing_data(Car.objects.all()), {'search': 'bmw'})
+        sql = str(queryset.query)
+        self.assertEqual(sql.count('MATCH'), 1)
+        self.assertEqual(queryset.count(), 2)
+        self.assertEqual(Car.objects.filter(id__in=queryset.values('id')).count(), 2)
+
+    def test_facets_with_search(self):
+        self.assertEqual(get_facets({'search': 'bmw'})['total'], 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ListingQueryCountTests(TestCase):
+    """Страница списка лотов строится постоянным числом запросов"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+
+    def add_lots(self, count):
+        for car in create_cars(self.seller, count):
+            CarImage.objects.create(car=car, image='cars/test.jpg', is_primary=True)
+            Bid.objects.create(car=car, bidder=self.bidder, amount=1100)
+
+    def assert_page_queries(self, url, params, num):
+        # Количество запросов не зависит от числа лотов на странице
+        for lots in (1, 9):
+            self.add_lots(lots)
+            cache.clear()
+            with self.subTest(lots=lots), self.assertNumQueries(num):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), min(Car.objects.count(), 10))
+
+    def test_car_list_create_view(self):
+        # COUNT(*), страница лотов с продавцом и числом ставок, основные изображения
+        self.assert_page_queries(reverse('auction:car-list-create'), {}, 3)
+
+    def test_car_filter_view(self):
+        self.assert_page_queries(reverse('auction:car-filter'), {'brand': 'BMW', 'sort': 'price_asc'}, 3)
+
+    def test_car_filter_view_approximate_count(self):
+        # Количество берется из кэша, пока состав списков не изменился
+        url = reverse('auction:car-filter')
+        self.add_lots(3)
+        self.client.get(url, {'count': 'approx'})
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'count': 'approx', 'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class KeysetPaginationTests(TestCase):
+    """Курсорная пагинация списка лотов"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        create_cars(self.seller, 3)
+        self.url = reverse('auction:car-filter')
+
+    def test_pages_follow_cursor(self):
+        response = self.client.get(self.url, {'cursor': '', 'page_size': 2})
+        ids = [car['id'] for car in response.data['results']]
+        cursor = parse_qs(urlsplit(response.data['next']).query)['cursor'][0]
+        response = self.client.get(self.url, {'cursor': cursor, 'page_size': 2})
+        ids += [car['id'] for car in response.data['results']]
+        self.assertEqual(sorted(ids), sorted(Car.objects.values_list('id', flat=True)))
+        self.assertIsNone(response.data['next'])
+
+    def test_tampered_cursor_is_not_found(self):
+        for value in (['not-a-date', 1], [None, 1], 'garbage'):
+            with self.subTest(value=value):
+                cursor = base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PlaceBidRaceTests(TransactionTestCase):
+    """Одновременные ставки на один лот"""
+
+    bidders_count = 5
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        self.bidders = [
+            User.objects.create_user(f'bidder{index}', f'bidder{index}@example.com', 'password')
+            for index in range(self.bidders_count)
+        ]
+        self.car = create_cars(self.seller, 1, min_bid_increment=100)[0]
+        order_book.invalidate(self.car.pk)
+        # Номера разосланных ставок: (seq, id ставки)
+        self.broadcasts = []
+        patcher = mock.patch(
+            'auction.services._broadcast_bid',
+            side_effect=lambda car, bid, previous: self.broadcasts.append((previous.bid_count + 1, bid.id))
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def race(self, amount):
+        """Все участники одновременно ставят amount, возвращает принятые ставки"""
+        barrier = threading.Barrier(len(self.bidders))
+        accepted, rejected = [], []
+
+        def bid(bidder):
+            try:
+                barrier.wait()
+                # Каждый поток работает со своей копией лота, как отдельный запрос
+                accepted.append(place_bid(Car.objects.get(pk=self.car.pk), bidder, Decimal(amount)))
+            except ValidationError as e:
+                rejected.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=bid, args=(bidder,)) for bidder in self.bidders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(accepted) + len(rejected), len(self.bidders))
+        return accepted
+
+    def test_single_winner(self):
+        accepted = self.race(1100)
+        self.assertEqual(len(accepted), 1)
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.current_price, Decimal('1100'))
+        self.assertEqual(list(self.car.bids.values_list('id', flat=True)), [accepted[0].id])
+
+    def test_seq_is_monotonic(self):
+        for amount in (1100, 1200, 1300, 1400):
+            self.assertEqual(len(self.race(amount)), 1)
+
+        bid_ids = list(self.car.bids.order_by('id').values_list('id', flat=True))
+        self.assertEqual(len(bid_ids), 4)
+        # Ставки получают номера 1..N подряд в порядке их записи
+        self.assertEqual(sorted(self.broadcasts), list(zip(range(1, 5), bid_ids)))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CarDetailCacheTests(TestCase):
+    """Кэш карточки лота и данные пользователей в ней"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+        self.car = create_cars(self.seller, 1)[0]
+        Bid.objects.create(car=self.car, bidder=self.bidder, amount=1100)
+        self.url = reverse('auction:car-detail', args=[self.car.pk])
+        self.client.force_login(self.bidder)
+
+    def get_detail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(self.url).data
+
+    def test_profile_change_invalidates_detail(self):
+        self.assertEqual(self.get_detail()['seller']['profile']['bio'], None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.profile.bio = 'Продаю автомобили'
+            self.seller.profile.save()
+        self.assertEqual(self.get_detail()['seller']['profile']['bio'], 'Продаю автомобили')
+
+    def test_bidder_rename_invalidates_detail(self):
+        self.get_detail()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bidder.username = 'renamed'
+            self.bidder.save()
+        self.assertEqual(self.get_detail()['bids'][0]['bidder']['username'], 'renamed')
+
+    def test_cached_detail_counts_down_time_remaining(self):
+        remaining = self.get_detail()['time_remaining']
+        later = timezone.now() + timedelta(minutes=10)
+        with mock.patch('django.utils.timezone.now', return_value=later), self.assertNumQueries(2):
+            data = self.client.get(self.url).data
+        self.assertLessEqual(data['time_remaining'], remaining - 600)
+        with mock.patch('django.utils.timezone.now', return_value=self.car.end_time + timedelta(seconds=1)):
+            self.assertEqual(self.client.get(self.url).data['time_remaining'], 0)
+
+    def test_login_keeps_cached_detail(self):
+        self.get_detail()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.last_login = timezone.now()
+            self.seller.save(update_fields=['last_login'])
+        with self.assertNumQueries(2):
+            # Только сессия и пользователь запроса: ответ берется из кэша
+            self.client.get(self.url)
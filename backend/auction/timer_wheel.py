@@ -0,0 +1,101 @@
+import math
+
+
+class TimerWheel:
+    """
+    Иерархическое колесо таймеров.
+
+    Время делится на тики длиной tick секунд. Уровень 0 содержит slots ячеек
+    по одному тику, каждый следующий уровень - slots ячеек по slots^level тиков.
+    Таймер помещается на самый нижний уровень, в пределах которого его срок
+    совпадает с текущим временем по всем старшим разрядам, и опускается на
+    нижние уровни по мере приближения срока. Добавление, отмена и продвижение
+    на один тик выполняются за O(1) без сортировки всех таймеров.
+    """
+
+    def __init__(self, now, tick=1.0, slots=64, levels=4):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = math.floor(now / tick)
+        self._wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        # Таймеры за пределами старшего уровня
+        self._overflow = set()
+        # Срок уже наступил на момент добавления
+        self._due = set()
+        self._deadlines = {}
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def keys(self):
+        return list(self._deadlines)
+
+    def schedule(self, key, when):
+        """Добавляет или переносит таймер key на момент when (секунды)"""
+        deadline = math.ceil(when / self.tick)
+        if self._deadlines.get(key) == deadline:
+            return
+        self.cancel(key)
+        self._deadlines[key] = deadline
+        self._place(key)
+
+    def cancel(self, key):
+        if key not in self._deadlines:
+            return False
+        self._buckets.pop(key).discard(key)
+        del self._deadlines[key]
+        return True
+
+    def advance(self, now):
+        """Продвигает колесо до момента now и возвращает ключи истекших таймеров"""
+        expired = []
+        target = math.floor(now / self.tick)
+        while self.current < target:
+            self.current += 1
+            self._cascade()
+            bucket = self._wheels[0][self.current % self.slots]
+            expired.extend(bucket)
+            bucket.clear()
+
+        expired.extend(self._due)
+        self._due.clear()
+        for key in expired:
+            del self._deadlines[key]
+            del self._buckets[key]
+        return expired
+
+    def _place(self, key):
+        deadline = self._deadlines[key]
+        if deadline <= self.current:
+            bucket = self._due
+        else:
+            bucket = self._overflow
+            for level in range(self.levels):
+                span = self.slots ** (level + 1)
+                if deadline // span == self.current // span:
+                    index = (deadline // self.slots ** level) % self.slots
+                    bucket = self._wheels[level][index]
+                    break
+        bucket.add(key)
+        self._buckets[key] = bucket
+
+    def _cascade(self):
+        # Таймеры старших уровней, чей блок начался, раскладываются ниже
+        if self.current % self.slots ** self.levels == 0:
+            self._redistribute(self._overflow)
+        for level in range(self.levels - 1, 0, -1):
+            span = self.slots ** level
+            if self.current % span == 0:
+                index = (self.current // span) % self.slots
+                self._redistribute(self._wheels[level][index])
+
+    def _redistribute(self, bucket):
+        keys = list(bucket)
+        bucket.clear()
+        for key in keys:
+            self._place(key)
@@ -2,7 +2,7 @@ from django.urls import path
 from .views import (
     CarListCreateView, CarDetailView, CarFilterView,
     BidCreateView, BidListView, AuctionHistoryView,
-    CarImageView, CarImageSetPrimaryView
+    CarImageView, CarImageSetPrimaryView, AuctionWatchersView, CarFacetsView
 )
 
 app_name = 'auction'
@@ -11,6 +11,8 @@ urlpatterns = [
     # Car endpoints
     path('cars/', CarListCreateView.as_view(), name='car-list-create'),
     path('cars/filter/', CarFilterView.as_view(), name='car-filter'),
+    path('cars/facets/', CarFacetsView.as_view(), name='car-facets'),
+    path('cars/watchers/', AuctionWatchersView.as_view(), name='car-watchers'),
     path('cars/<int:pk>/', CarDetailView.as_view(), name='car-detail'),
     
     # Bid endpoints
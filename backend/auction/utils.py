@@ -1,5 +1,32 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, Exists, OuterRef, Subquery
+
+from .order_book import order_book
+from . import facets
+from .cache import invalidate_cars
+
+logger = logging.getLogger(__name__)
+
+def encode_event(handler, payload, **fields):
+    """
+    Готовит событие для group_send: полезная нагрузка кодируется в JSON один раз
+    и отправляется каждому подписчику группы как есть, а её тип передается
+    отдельным полем message_type, чтобы обработчикам не нужно было разбирать JSON.
+    Дополнительные поля fields передаются рядом с закодированным сообщением
+    """
+    return {
+        'type': handler,
+        'message_type': payload.get('type'),
+        'message': json.dumps(payload),
+        **fields,
+    }
 
 def get_highest_bid(car):
     """
@@ -7,38 +34,128 @@ def get_highest_bid(car):
     """
     return car.bids.order_by('-amount').first()
 
-def complete_expired_auctions():
+def complete_expired_auctions(car_ids=None):
     """
-    Завершает аукционы, которые истекли
+    Завершает аукционы, которые истекли.
+    Если передан car_ids, проверяются только указанные лоты.
+
+    Завершение выполняется набором запросов, не зависящим от числа лотов:
+    победители всех лотов определяются одним запросом с подзапросом,
+    история создается одним bulk_create, статусы меняются одним UPDATE,
+    уведомления отправляются одной пачкой после фиксации транзакции.
     """
-    from .models import Car, AuctionHistory
-    
+    from .models import Car, Bid, AuctionHistory
+
     now = timezone.now()
-    
+
     # Находим все активные аукционы, срок которых истек
     expired_auctions = Car.objects.filter(
         status='active',
         end_time__lte=now
     )
-    
-    count = 0
-    for car in expired_auctions:
-        # Меняем статус на "completed"
-        car.status = 'completed'
-        car.save(update_fields=['status'])
-        
-        # Получаем последнюю ставку (если есть)
-        highest_bid = get_highest_bid(car)
-        
-        # Создаем историю аукциона, если её еще нет
-        if not hasattr(car, 'auction_history'):
-            AuctionHistory.objects.create(
-                car=car,
-                winner=highest_bid.bidder if highest_bid else None,
-                final_price=highest_bid.amount if highest_bid else car.current_price,
+    if car_ids is not None:
+        expired_auctions = expired_auctions.filter(id__in=car_ids)
+
+    # Самая высокая ставка по каждому лоту
+    highest_bids = Bid.objects.filter(car=OuterRef('pk')).order_by('-amount')
+
+    with transaction.atomic():
+        expired = list(
+            expired_auctions.select_for_update().annotate(
+                winner_id=Subquery(highest_bids.values('bidder_id')[:1]),
+                winning_amount=Subquery(highest_bids.values('amount')[:1]),
+                has_history=Exists(AuctionHistory.objects.filter(car=OuterRef('pk'))),
+            ).values(
+                'id', 'brand', 'model', 'year', 'seller_id', 'current_price',
+                'winner_id', 'winning_amount', 'has_history'
+            )
+        )
+        if not expired:
+            return 0
+
+        # Создаем историю для лотов, у которых её еще нет
+        AuctionHistory.objects.bulk_create([
+            AuctionHistory(
+                car_id=car['id'],
+                winner_id=car['winner_id'],
+                final_price=car['winning_amount'] or car['current_price'],
                 ended_at=now
             )
-        
-        count += 1
-    
-    return count
\ No newline at end of file
+            for car in expired if not car['has_history']
+        ], ignore_conflicts=True)
+
+        # Меняем статус на "completed" одним запросом, сигналы post_save не вызываются
+        Car.objects.filter(
+            id__in=[car['id'] for car in expired],
+            status='active'
+        ).update(status='completed')
+        facets.move_status(expired, 'active', 'completed')
+
+        transaction.on_commit(lambda: invalidate_cars([car['id'] for car in expired], listings=True))
+        transaction.on_commit(lambda: send_completion_notifications(expired, now))
+
+    return len(expired)
+
+def send_completion_notifications(cars, now):
+    """
+    Отправляет одной пачкой состояние завершенных лотов в группы auction_{id}
+    и уведомления победителям
+    """
+    order_book.record_completion([car['id'] for car in cars])
+
+    messages = []
+    for car in cars:
+        messages.append((f"auction_{car['id']}", encode_event('auction_state', {
+            'type': 'auction_state',
+            'car_id': car['id'],
+            'current_price': float(car['winning_amount'] or car['current_price']),
+            'status': 'completed',
+            'time_remaining': 0,
+        }, status='completed')))
+
+        feed_update = {
+            'type': 'auction_update',
+            'car_id': car['id'],
+            'current_price': float(car['winning_amount'] or car['current_price']),
+            'status': 'completed',
+        }
+        messages.append(('auctions', feed_update))
+        messages.append((f"auction_feed_{car['id']}", feed_update))
+
+        # Уведомления получают только победители лотов без истории
+        if car['has_history'] or not car['winner_id']:
+            continue
+
+        winner_id = car['winner_id']
+        final_price = float(car['winning_amount'])
+        messages.append((f"notifications_{winner_id}", encode_event('notification_update', {
+            'type': 'auction_won',
+            'user_id': winner_id,
+            'car_id': car['id'],
+            'car_brand': car['brand'],
+            'car_model': car['model'],
+            'final_price': final_price,
+            'timestamp': now.isoformat(),
+            'seller_id': car['seller_id'],
+        })))
+        messages.append((f"user_{winner_id}", {
+            'type': 'auction_won_notification',
+            'user_id': winner_id,
+            'car_id': car['id'],
+            'car_brand': car['brand'],
+            'car_model': car['model'],
+            'final_price': final_price,
+            'seller_id': car['seller_id']
+        }))
+
+    channel_layer = get_channel_layer()
+
+    async def send_all():
+        await asyncio.gather(*(
+            channel_layer.group_send(group, message) for group, message in messages
+        ))
+
+    try:
+        async_to_sync(send_all)()
+    except Exception as e:
+        logger.exception(f"Error sending auction completion notifications: {str(e)}")
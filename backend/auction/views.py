@@ -1,30 +1,47 @@
-from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import MultiPartParser, FormParser
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-import json
 import logging
-from decimal import Decimal
 
 logger = logging.getLogger(__name__) # Assuming logger is configured elsewhere
 
 from .models import Car, Bid, AuctionHistory, CarImage
-from .utils import complete_expired_auctions
+from .services import place_bid
+from .filters import filter_cars
+from .pagination import CarPagination, KeysetPagination
+from .presence import watcher_totals
+from .facets import get_facets
+from .cache import CachedResponseMixin, CachedListMixin
 from .serializers import (
-    CarListSerializer, CarDetailSerializer, BidSerializer,
+    CarListSerializer, CarCardSerializer, CarDetailSerializer, BidSerializer,
     AuctionHistorySerializer, CarImageSerializer
 )
 
-# Custom pagination for cars
-class CarPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 50
+def with_listing_data(queryset):
+    """
+    Добавляет к выборке лотов все, что нужно CarListSerializer, чтобы
+    страница списка строилась постоянным числом запросов: количество ставок,
+    продавца с профилем и основное изображение.
+
+    Количество ставок считается коррелированным подзапросом по индексу
+    car_id только для строк страницы; Count('bids') через JOIN
+    требовал GROUP BY всей выборки и временного B-дерева для сортировки
+    """
+    bid_count = Bid.objects.filter(car=OuterRef('pk')).order_by().values('car').annotate(
+        total=Count('id')
+    ).values('total')
+    return queryset.select_related('seller__profile').annotate(
+        bid_count=Coalesce(Subquery(bid_count), 0)
+    ).prefetch_related(
+        Prefetch(
+            'images',
+            queryset=CarImage.objects.order_by('-is_primary', '-created_at')[:1],
+            to_attr='primary_images'
+        )
+    )
 
 # Permission classes
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -35,7 +52,7 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
 
 # Представления для тегов и способов оплаты удалены
 
-class CarListCreateView(generics.ListCreateAPIView):
+class CarListCreateView(CachedListMixin, generics.ListCreateAPIView):
     serializer_class = CarDetailSerializer
     pagination_class = CarPagination
     parser_classes = (MultiPartParser, FormParser)
@@ -44,6 +61,12 @@ class CarListCreateView(generics.ListCreateAPIView):
         if self.request.method == 'GET':
             return [permissions.AllowAny()]
         return [permissions.IsAuthenticated()]
+
+    def get_serializer_class(self):
+        # Список отдается в компактном виде, полные данные лота - в CarDetailView
+        if self.request.method == 'GET':
+            return CarCardSerializer
+        return CarDetailSerializer
         
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -51,7 +74,9 @@ class CarListCreateView(generics.ListCreateAPIView):
         return context
 
     def get_queryset(self):
-        return Car.objects.filter(status__in=['active', 'pending'])
+        return with_listing_data(
+            Car.objects.filter(status__in=['active', 'pending'])
+        ).order_by('-created_at')
 
     def perform_create(self, serializer):
         try:
@@ -60,10 +85,20 @@ class CarListCreateView(generics.ListCreateAPIView):
             logger.error(f"Error creating car auction: {str(e)}")
             raise serializers.ValidationError("Ошибка при создании аукциона. Пожалуйста, проверьте введенные данные.")
 
-class CarFilterView(generics.ListAPIView):
+class CarFilterView(CachedListMixin, generics.ListAPIView):
     serializer_class = CarListSerializer
     permission_classes = [permissions.AllowAny]  # Изменено для публичного доступа
     pagination_class = CarPagination
+
+    @property
+    def paginator(self):
+        # С параметром cursor используется курсорная пагинация вместо номеров страниц
+        if not hasattr(self, '_paginator'):
+            if 'cursor' in self.request.query_params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -71,74 +106,27 @@ class CarFilterView(generics.ListAPIView):
         return context
 
     def get_queryset(self):
-        # Сначала проверим и завершим все истекшие аукционы
-        complete_expired_auctions()
-        
-        queryset = Car.objects.all()
-
-        # Filter by price range
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
-        if min_price:
-            queryset = queryset.filter(current_price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(current_price__lte=max_price)
-
-        # Фильтрация по тегам и способам оплаты удалена
-
-        # Filter by seller loyalty/rating
-        min_rating = self.request.query_params.get('min_rating')
-        if min_rating:
-            queryset = queryset.filter(seller__profile__rating__gte=min_rating)
-
-        # Search by keyword in brand, model or description
-        search = self.request.query_params.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(brand__icontains=search) | 
-                Q(model__icontains=search) | 
-                Q(description__icontains=search)
-            )
+        # Истекшие аукционы завершает планировщик run_auction_scheduler
+        queryset = with_listing_data(Car.objects.all())
+        return filter_cars(queryset, self.request.query_params)
 
-        # Sort by price
-        sort = self.request.query_params.get('sort')
-        if sort == 'price_asc':
-            queryset = queryset.order_by('current_price')
-        elif sort == 'price_desc':
-            queryset = queryset.order_by('-current_price')
-        else:
-            # Default sort by created date (newest first)
-            queryset = queryset.order_by('-created_at')
-
-        # Filter by status
-        status_filter = self.request.query_params.get('status')
-        now = timezone.now()
-        
-        if status_filter:
-            if status_filter == 'active':
-                # For active auctions, also check if they are not expired
-                queryset = queryset.filter(status='active', end_time__gt=now)
-            elif status_filter == 'completed':
-                # Show completed auctions
-                queryset = queryset.filter(status='completed')
-            elif status_filter == 'cancelled':
-                # Show cancelled auctions
-                queryset = queryset.filter(status='cancelled')
-            elif status_filter == 'all':
-                # Show all auctions regardless of status
-                pass
-            else:
-                queryset = queryset.filter(status=status_filter)
-        else:
-            # Default to only active and non-expired auctions
-            queryset = queryset.filter(status='active', end_time__gt=now)
+class CarFacetsView(generics.GenericAPIView):
+    """
+    Количество лотов по марке, диапазону годов, ценовому диапазону и статусу
+    для фильтра с параметрами CarFilterView
+    """
+    permission_classes = [permissions.AllowAny]
 
-        return queryset
+    def get(self, request):
+        return Response(get_facets(request.query_params))
 
-class CarDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CarDetailView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Car.objects.all()
     serializer_class = CarDetailSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    # Карточка лота одинакова для всех пользователей. Данные продавца и участников
+    # торгов в ней сбрасываются при изменении пользователя или профиля (auction.signals)
+    cache_anonymous_only = False
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -156,6 +144,24 @@ class CarDetailView(generics.RetrieveUpdateDestroyAPIView):
             raise ValidationError("You cannot delete completed or cancelled auctions")
         instance.delete()
 
+class AuctionWatchersView(generics.GenericAPIView):
+    """
+    Число WebSocket-зрителей лотов по всем процессам, самые просматриваемые первыми.
+    Параметры: car_ids=1,2,3 - только указанные лоты, limit - число лотов (до 100)
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        car_ids = request.query_params.get('car_ids')
+        try:
+            if car_ids:
+                car_ids = [int(car_id) for car_id in car_ids.split(',') if car_id]
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            raise ValidationError({'error': 'car_ids and limit must be integers'})
+
+        return Response(watcher_totals(car_ids=car_ids or None, limit=limit))
+
 class BidListView(generics.ListAPIView):
     serializer_class = BidSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -165,6 +171,17 @@ class BidListView(generics.ListAPIView):
         context.update({'request': self.request})
         return context
 
+    @property
+    def paginator(self):
+        # По умолчанию возвращается весь список ставок,
+        # с параметром cursor - страницы по (amount, id)
+        if not hasattr(self, '_paginator'):
+            if 'cursor' in self.request.query_params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = None
+        return self._paginator
+
     def get_queryset(self):
         car_id = self.kwargs.get('car_id')
         return Bid.objects.filter(car_id=car_id).order_by('-amount')
@@ -179,91 +196,15 @@ class BidCreateView(generics.CreateAPIView):
         return context
 
     def perform_create(self, serializer):
-        car_id = serializer.validated_data['car'].id
+        car = serializer.validated_data['car']
         amount = serializer.validated_data['amount']
 
+        # Сериализатор выполняет предварительные проверки, окончательная
+        # проверка и применение ставки выполняются атомарно в place_bid
         try:
-            car = Car.objects.get(id=car_id)
-            
-            # Все валидации теперь выполняются в сериализаторе BidSerializer
-            # Включая проверки:
-            # - Активность аукциона
-            # - Нельзя ставить на свой аукцион 
-            # - Нельзя перебивать свою ставку
-            # - Сумма ставки должна быть не меньше min_required
-            
-            # Создаем ставку
-            bid = serializer.save(bidder=self.request.user)
-            
-            # Обновляем текущую цену аукциона
-            car.current_price = amount
-            car.save()
-
-            # Подготовка данных для отправки через WebSocket
-            bid_data = {
-                'type': 'bid_update',
-                'bid': {
-                    'id': bid.id,
-                    'amount': float(amount),
-                    'created_at': timezone.now().isoformat(),
-                    'bidder': {
-                        'id': self.request.user.id,
-                        'username': self.request.user.username
-                    }
-                },
-                'car_id': car.id,
-                'current_price': float(car.current_price),
-            }
-
-            # Send real-time update via WebSocket to all auction viewers
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"auction_{car.id}",
-                {
-                    'type': 'bid_update',
-                    'message': json.dumps(bid_data)
-                }
-            )
-            
-            # Получаем предыдущую ставку, чтобы отправить уведомление
-            previous_bid = Bid.objects.filter(car_id=car.id).exclude(bidder=self.request.user).order_by('-created_at').first()
-            
-            # Если была предыдущая ставка от другого пользователя, отправляем уведомление
-            if previous_bid:
-                # Send outbid notification to the user through auction notifications
-                async_to_sync(channel_layer.group_send)(
-                    f"notifications_{previous_bid.bidder.id}",
-                    {
-                        'type': 'notification_update',
-                        'message': json.dumps({
-                            'type': 'outbid',
-                            'user_id': previous_bid.bidder.id,
-                            'car_id': car.id,
-                            'car_brand': car.brand,
-                            'car_model': car.model,
-                            'amount': float(amount),
-                            'timestamp': timezone.now().isoformat(),
-                        })
-                    }
-                )
-                
-                # Also send to user's chat notifications
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{previous_bid.bidder.id}",
-                    {
-                        'type': 'auction_outbid_notification',
-                        'user_id': previous_bid.bidder.id,
-                        'car_id': car.id,
-                        'car_brand': car.brand,
-                        'car_model': car.model,
-                        'new_bid_amount': float(amount)
-                    }
-                )
-
-        except Car.DoesNotExist:
-            raise ValidationError({'error': 'Car not found'})
-        except ValueError:
-            raise ValidationError({'error': 'Invalid bid amount'})
+            serializer.instance = place_bid(car, self.request.user, amount)
+        except ValidationError:
+            raise
         except Exception as e:
             logger.exception(f"Error creating bid: {str(e)}") # Log the exception for debugging
             raise ValidationError({'error': 'Failed to place bid'})
@@ -351,9 +292,6 @@ class AuctionHistoryView(generics.ListAPIView):
         return context
 
     def get_queryset(self):
-        # Сначала проверим и завершим все истекшие аукционы
-        complete_expired_auctions()
-        
         car_id = self.kwargs.get('car_id')
         user = self.request.user
 
@@ -4,7 +4,7 @@ from .models import Conversation, Message
 class MessageInline(admin.TabularInline):
     model = Message
     extra = 0
-    readonly_fields = ['sender', 'content', 'timestamp', 'is_read']
+    readonly_fields = ['sender', 'content', 'timestamp']
     can_delete = False
     
     def has_add_permission(self, request, obj=None):
@@ -24,8 +24,8 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['id', 'sender', 'get_conversation', 'short_content', 'timestamp', 'is_read']
-    list_filter = ['timestamp', 'is_read', 'sender']
+    list_display = ['id', 'sender', 'get_conversation', 'short_content', 'timestamp']
+    list_filter = ['timestamp', 'sender']
     search_fields = ['content', 'sender__username']
     readonly_fields = ['timestamp']
     
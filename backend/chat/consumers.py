@@ -2,10 +2,14 @@ import json
 import datetime
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Conversation, Message
-from .serializers import MessageSerializer
+from .ingest import message_ingest
+from .membership import conversation_members
+from config.outbound import OutboundQueueMixin
+
+class ChatConsumer(OutboundQueueMixin, AsyncWebsocketConsumer):
+    # Участники диалога, запомненные соединением; сбрасываются событием members_changed
+    members = None
 
-class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
         self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
@@ -49,74 +53,43 @@ class ChatConsumer(AsyncWebsocketConsumer):
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type', 'message')
             
-            if message_type == 'message':
-                # Обработка нового сообщения
-                content = text_data_json.get('content')
+            if message_type in ('message', 'chat_message'):
+                # Некоторые клиенты отправляют текст в поле message (тип chat_message)
+                content = text_data_json.get('content') if message_type == 'message' else text_data_json.get('message')
                 temp_id = text_data_json.get('temp_id', None)
                 
+                if content and not await self.is_conversation_participant():
+                    # Пользователь удален из диалога после подключения
+                    await self.close(code=4003)
+                    return
+
                 if content:
-                    # Сохранение сообщения в базу данных
-                    message = await self.save_message(content)
-                    
-                    # Немедленная отправка сообщения всем участникам
-                    # Сериализуем сообщение для отправки
-                    serializer = await self.serialize_message(message)
-                    
-                    # Добавим информацию о временном ID, если он был передан
-                    if temp_id:
-                        serializer['temp_id'] = temp_id
-                    
-                    # Немедленно отправляем подтверждение отправителю
-                    await self.send(text_data=json.dumps({
-                        'type': 'message_sent',
-                        'message': serializer,
-                        'status': 'success'
-                    }))
-                    
-                    # Отправляем сообщение всем участникам диалога
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            "type": "chat_message",
-                            "message": serializer
-                        }
+                    # Сообщение записывается пачкой вместе с пришедшими одновременно,
+                    # сериализуется и рассылается в группы один раз; ответ приходит
+                    # после фиксации записи. Повторная отправка с тем же temp_id
+                    # не создает дубликат
+                    message_data, _ = await message_ingest.submit(
+                        self.conversation_id, self.user, content, temp_id
                     )
-            
-            elif message_type == 'chat_message':
-                # Обрабатываем сообщение, если оно пришло через метод нативного WebSocket
-                # в некоторых клиентах
-                content = text_data_json.get('message')
-                temp_id = text_data_json.get('temp_id', None)
-                
-                if content:
-                    # Сохранение сообщения в базу данных
-                    message = await self.save_message(content)
-                    
-                    # Сериализуем сообщение для отправки
-                    serializer = await self.serialize_message(message)
                     
-                    # Добавим информацию о временном ID, если он был передан
-                    if temp_id:
-                        serializer['temp_id'] = temp_id
-                    
-                    # Отправляем сообщение всем участникам диалога
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            "type": "chat_message",
-                            "message": serializer
-                        }
-                    )
+                    if message_type == 'message':
+                        # Подтверждение отправителю идет через ту же очередь, что и
+                        # сообщения диалога, и не обгоняет их
+                        await self.queue_send(json.dumps({
+                            'type': 'message_sent',
+                            'message': message_data,
+                            'status': 'success'
+                        }))
             
             elif message_type == 'ping':
                 # Отвечаем на ping сообщения для поддержания соединения
-                await self.send(text_data=json.dumps({
+                await self.queue_send(json.dumps({
                     'type': 'pong',
                     'timestamp': json.dumps(str(datetime.datetime.now()))
                 }))
         except Exception as e:
             # Отправляем информацию об ошибке клиенту
-            await self.send(text_data=json.dumps({
+            await self.queue_send(json.dumps({
                 'type': 'error',
                 'message': str(e),
                 'status': 'error'
@@ -136,42 +109,31 @@ class ChatConsumer(AsyncWebsocketConsumer):
         else:
             message_with_receiver['is_own'] = False
             
-        # Отправка сообщения клиенту
-        await self.send(text_data=json.dumps({
+        # Отправка сообщения клиенту через исходящую очередь
+        await self.queue_send(json.dumps({
             'type': 'message',
             'message': message_with_receiver
         }))
     
     async def new_message_notification(self, event):
         # Отправка уведомления о новом сообщении
-        await self.send(text_data=json.dumps({
+        await self.queue_send(json.dumps({
             'type': 'notification',
             'message': event['message']
         }))
     
-    @database_sync_to_async
-    def is_conversation_participant(self):
-        try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return conversation.participants.filter(id=self.user.id).exists()
-        except Conversation.DoesNotExist:
-            return False
-    
-    @database_sync_to_async
-    def save_message(self, content):
-        conversation = Conversation.objects.get(id=self.conversation_id)
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=self.user,
-            content=content
-        )
-        return message
-        
-    @database_sync_to_async
-    def serialize_message(self, message):
-        """Сериализует модель сообщения в JSON-совместимый формат для отправки через WebSocket"""
-        serializer = MessageSerializer(message)
-        return serializer.data
+    async def members_changed(self, event):
+        # Участники диалога изменились: следующая проверка загрузит их заново
+        self.members = None
+
+    async def is_conversation_participant(self):
+        # Проверка по участникам, запомненным соединением, без перехода в пул
+        # потоков; при промахе участники берутся из общего кэша или из БД
+        if self.members is None:
+            self.members = await database_sync_to_async(conversation_members.participants)(
+                self.conversation_id
+            )
+        return self.user.id in self.members
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
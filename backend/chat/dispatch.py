@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import IntegrityError, transaction
+
+from .membership import conversation_members
+from .models import Message
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_message(conversation, sender, content, temp_id=None):
+    """
+    Единственный путь создания сообщения чата (WebSocket, HTTP, start_conversation).
+
+    Сообщение сохраняется, сериализуется один раз и после фиксации транзакции
+    одной пачкой рассылается в группу диалога chat_{id} и в персональные
+    группы user_{id} остальных участников. Повторная отправка с тем же
+    temp_id не создает сообщение и ничего не рассылает, а возвращает
+    сохраненное ранее.
+
+    Возвращает (данные сообщения, created).
+    """
+    temp_id = str(temp_id)[:64] if temp_id else None
+    try:
+        with transaction.atomic():
+            message = Message.objects.create(
+                conversation=conversation,
+                sender=sender,
+                content=content,
+                temp_id=temp_id
+            )
+    except IntegrityError:
+        if temp_id is None:
+            raise
+        message = Message.objects.select_related('sender__profile').get(
+            conversation=conversation,
+            sender=sender,
+            temp_id=temp_id
+        )
+        return MessageSerializer(message).data, False
+
+    message_data = MessageSerializer(message).data
+    transaction.on_commit(lambda: broadcast_message(message, message_data))
+    return message_data, True
+
+
+def message_events(message, message_data, recipient_ids):
+    """События group_send для нового сообщения: в диалог и уведомления получателям"""
+    content = message.content
+    notification = {
+        "type": "new_message_notification",
+        "message": {
+            "conversation_id": message.conversation_id,
+            "sender_name": message.sender.username,
+            "content": content[:50] + ('...' if len(content) > 50 else ''),
+            "timestamp": message.timestamp.isoformat()
+        }
+    }
+    events = [(f"chat_{message.conversation_id}", {"type": "chat_message", "message": message_data})]
+    events.extend((f"user_{user_id}", notification) for user_id in recipient_ids)
+    return events
+
+
+async def send_events(events):
+    """Отправляет события в группы одной пачкой"""
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(
+        channel_layer.group_send(group, event) for group, event in events
+    ))
+
+
+def broadcast_message(message, message_data):
+    """Рассылает новое сообщение в диалог и уведомления участникам одной пачкой"""
+    recipients = conversation_members.participants(message.conversation_id) - {message.sender_id}
+    try:
+        async_to_sync(send_events)(message_events(message, message_data, recipients))
+    except Exception as e:
+        logger.exception(f"Error broadcasting chat message {message.pk}: {str(e)}")
@@ -0,0 +1,117 @@
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Subquery, F, Case, When, Value
+from django.db.models.functions import Coalesce
+
+from .models import Conversation, Message, UnreadCounter
+
+User = get_user_model()
+
+# Размер окна истории сообщений по умолчанию и максимальный
+MESSAGE_WINDOW = 50
+MAX_MESSAGE_WINDOW = 100
+
+
+def message_window(conversation, before=None, after=None, limit=MESSAGE_WINDOW):
+    """
+    Окно истории диалога по id сообщения (keyset, без OFFSET).
+
+    before - сообщения старше указанного id, after - новее него,
+    без параметров - последние limit сообщений. Сообщения возвращаются
+    в хронологическом порядке вместе с признаком has_more - есть ли
+    еще сообщения в направлении запроса. Отправители загружаются
+    одним запросом на всё окно.
+    """
+    queryset = Message.objects.filter(conversation=conversation)
+    if after is not None:
+        queryset = queryset.filter(id__gt=after).order_by('id')
+    else:
+        if before is not None:
+            queryset = queryset.filter(id__lt=before)
+        queryset = queryset.order_by('-id')
+
+    messages = list(queryset[:limit + 1])
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after is None:
+        messages.reverse()
+
+    senders = User.objects.select_related('profile').in_bulk(
+        {message.sender_id for message in messages}
+    )
+    for message in messages:
+        message.sender = senders[message.sender_id]
+    return messages, has_more
+
+
+def read_marks(conversation):
+    """Граница прочтения каждого участника диалога: {user_id: last_read_message_id}"""
+    return dict(
+        UnreadCounter.objects.filter(conversation=conversation).values_list('user_id', 'last_read_message_id')
+    )
+
+
+def is_read(message, marks):
+    """Прочитано ли сообщение: граница прочтения другого участника дошла до него"""
+    return any(
+        last_read >= message.id for user_id, last_read in marks.items()
+        if user_id != message.sender_id
+    )
+
+
+def mark_read(conversation, user, message_id=None):
+    """
+    Отмечает сообщения диалога прочитанными пользователем до message_id
+    включительно (по умолчанию - до последнего сообщения).
+
+    Меняется одна строка UnreadCounter: граница прочтения только растет,
+    а счетчик пересчитывается тем же запросом по сообщениям после
+    границы, поэтому сообщение, пришедшее одновременно, не теряется.
+    Граница не может пройти последнее сообщение диалога, иначе еще не
+    отправленные сообщения заранее считались бы прочитанными.
+    """
+    last_message_id = conversation.last_message_id
+    if not last_message_id:
+        return 0
+    message_id = last_message_id if message_id is None else min(message_id, last_message_id)
+    unread = Message.objects.filter(
+        conversation_id=conversation.pk,
+        id__gt=message_id
+    ).exclude(sender_id=user.pk).order_by().values('conversation_id').annotate(
+        total=Count('id')
+    ).values('total')
+    return UnreadCounter.objects.filter(
+        conversation_id=conversation.pk,
+        user_id=user.pk,
+        last_read_message_id__lt=message_id
+    ).update(
+        last_read_message_id=message_id,
+        count=Coalesce(Subquery(unread), 0)
+    )
+
+
+def record_new_messages(messages):
+    """
+    Учитывает новые сообщения в сводке диалогов: последнее сообщение,
+    дата обновления и счетчики непрочитанных остальных участников.
+    Выполняет два UPDATE на диалог независимо от числа сообщений
+    """
+    by_conversation = defaultdict(list)
+    for message in messages:
+        by_conversation[message.conversation_id].append(message)
+
+    for conversation_id, conversation_messages in by_conversation.items():
+        last_message = max(conversation_messages, key=lambda message: (message.timestamp, message.id))
+        Conversation.objects.filter(pk=conversation_id).update(
+            last_message=last_message,
+            updated_at=last_message.timestamp
+        )
+        # Участник получает все сообщения пачки, кроме собственных
+        sent = Counter(message.sender_id for message in conversation_messages)
+        UnreadCounter.objects.filter(conversation_id=conversation_id).update(
+            count=F('count') + len(conversation_messages) - Case(
+                *(When(user_id=user_id, then=Value(total)) for user_id, total in sent.items()),
+                default=Value(0)
+            )
+        )
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .dispatch import dispatch_message, message_events, send_events
+from .history import record_new_messages
+from .membership import conversation_members
+from .models import Conversation, Message
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+class MessageIngestBuffer:
+    """
+    Буфер записи сообщений чата из ChatConsumer.
+
+    Сообщения, пришедшие в течение delay секунд (или до max_batch штук),
+    записываются одним переходом в пул потоков: один bulk_create, по два
+    UPDATE сводки на диалог (последнее сообщение, updated_at и счетчики
+    непрочитанных) и одна пачка group_send. submit возвращает данные
+    сообщения только после фиксации транзакции, поэтому подтверждение
+    отправителю не опережает запись. Сообщение с уже записанным temp_id
+    не создается повторно и не рассылается.
+    """
+
+    def __init__(self, delay=0.005, max_batch=100):
+        self.delay = delay
+        self.max_batch = max_batch
+        self._pending = []
+        self._task = None
+
+    async def submit(self, conversation_id, sender, content, temp_id=None):
+        """Ставит сообщение в очередь записи, возвращает (данные сообщения, created)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        temp_id = str(temp_id)[:64] if temp_id else None
+        self._pending.append((int(conversation_id), sender, content, temp_id, future))
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = asyncio.ensure_future(self._run())
+        return await future
+
+    async def _run(self):
+        if len(self._pending) < self.max_batch:
+            await asyncio.sleep(self.delay)
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        try:
+            results, events = await database_sync_to_async(self.write)(
+                [item[:4] for item in batch]
+            )
+        except Exception as e:
+            logger.exception(f"Error writing {len(batch)} chat messages: {str(e)}")
+            for item in batch:
+                if not item[4].done():
+                    item[4].set_exception(e)
+            return
+
+        try:
+            await send_events(events)
+        except Exception as e:
+            logger.exception(f"Error broadcasting chat messages: {str(e)}")
+
+        for item, result in zip(batch, results):
+            # Отправитель мог отключиться, не дождавшись записи
+            if item[4].done():
+                continue
+            if isinstance(result, Exception):
+                item[4].set_exception(result)
+            else:
+                item[4].set_result(result)
+
+    def write(self, items):
+        """
+        Записывает пачку (conversation_id, sender, content, temp_id).
+        Возвращает результаты в порядке items и события для рассылки;
+        результат сообщения, которое не удалось записать, - исключение
+        """
+        try:
+            with transaction.atomic():
+                return self._write_batch(items)
+        except IntegrityError:
+            # Сообщение с тем же temp_id записано параллельно (например, по HTTP)
+            # или диалог удален: пачка откатывается и записывается по одному
+            # сообщению, ошибка одного сообщения не влияет на остальные
+            return [self._write_one(*item) for item in items], []
+
+    def _write_one(self, conversation_id, sender, content, temp_id):
+        try:
+            return dispatch_message(Conversation(pk=conversation_id), sender, content, temp_id=temp_id)
+        except Exception as e:
+            logger.exception(f"Error writing chat message to conversation {conversation_id}: {str(e)}")
+            return e
+
+    def _write_batch(self, items):
+        keys = {
+            (conversation_id, sender.pk, temp_id)
+            for conversation_id, sender, content, temp_id in items if temp_id
+        }
+        existing = {}
+        if keys:
+            lookup = Q()
+            for conversation_id, sender_id, temp_id in keys:
+                lookup |= Q(conversation_id=conversation_id, sender_id=sender_id, temp_id=temp_id)
+            for message in Message.objects.filter(lookup):
+                existing[(message.conversation_id, message.sender_id, message.temp_id)] = message
+
+        # Новые сообщения, повторы temp_id внутри пачки записываются один раз
+        new_messages = {}
+        for index, (conversation_id, sender, content, temp_id) in enumerate(items):
+            key = (conversation_id, sender.pk, temp_id) if temp_id else index
+            if key not in existing and key not in new_messages:
+                new_messages[key] = Message(
+                    conversation_id=conversation_id,
+                    sender_id=sender.pk,
+                    content=content,
+                    temp_id=temp_id
+                )
+        created = Message.objects.bulk_create(list(new_messages.values()))
+        record_new_messages(created)
+
+        # Отправители загружаются и сериализуются один раз на пачку
+        senders = User.objects.select_related('profile').in_bulk(
+            {sender.pk for conversation_id, sender, content, temp_id in items}
+        )
+        messages = {**existing, **new_messages}
+        for message in messages.values():
+            message.sender = senders[message.sender_id]
+        serializer_context = {'senders': {}}
+        data = {
+            key: MessageSerializer(message, context=serializer_context).data
+            for key, message in messages.items()
+        }
+
+        events = []
+        for key, message in new_messages.items():
+            recipients = conversation_members.participants(message.conversation_id) - {message.sender_id}
+            events.extend(message_events(message, data[key], recipients))
+
+        results = []
+        seen = set()
+        for index, (conversation_id, sender, content, temp_id) in enumerate(items):
+            key = (conversation_id, sender.pk, temp_id) if temp_id else index
+            results.append((data[key], key in new_messages and key not in seen))
+            seen.add(key)
+        return results, events
+
+
+message_ingest = MessageIngestBuffer()
@@ -0,0 +1,77 @@
+import uuid
+
+from django.core.cache import cache
+
+from .models import Conversation
+
+# Поколение всего кэша участников: меняется, когда неизвестно, какие диалоги изменились
+MEMBERS_GENERATION = 'chat_members_gen'
+
+
+class MembershipCache:
+    """
+    Кэш участников диалогов в общем кэше Django: id диалога -> frozenset id пользователей.
+
+    Проверки доступа к чату (ChatConsumer, IsParticipant, отправка сообщений)
+    выполняются по кэшу без запросов к БД. Запись хранится вместе с версией
+    диалога и поколением кэша - случайными метками, как версии лотов в
+    auction.cache. Изменение участников (chat.signals) меняет версию
+    диалога во всех процессах сразу, а запись, загруженная из БД до этого,
+    не совпадет с новой версией и будет загружена заново.
+    """
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+
+    def entry_key(self, conversation_id):
+        return f'chat_members:{conversation_id}'
+
+    def version_key(self, conversation_id):
+        return f'chat_members_version:{conversation_id}'
+
+    def _versions(self, conversation_id):
+        """Запись кэша и текущие (версия диалога, поколение), обычно одним запросом к кэшу"""
+        keys = [self.entry_key(conversation_id), self.version_key(conversation_id), MEMBERS_GENERATION]
+        values = cache.get_many(keys)
+        missing = [key for key in keys[1:] if key not in values]
+        if missing:
+            # Отсутствующая (или вытесненная) метка создается заново, поэтому
+            # записи, сохраненные с прежней меткой, перестают ей соответствовать
+            for key in missing:
+                cache.add(key, uuid.uuid4().hex, None)
+            values.update(cache.get_many(missing))
+        return values.get(keys[0]), (values.get(keys[1]), values.get(keys[2]))
+
+    def participants(self, conversation_id):
+        """Участники диалога, при промахе загружаются одним запросом"""
+        conversation_id = int(conversation_id)
+        entry, versions = self._versions(conversation_id)
+        if entry is not None and entry['versions'] == versions:
+            return frozenset(entry['members'])
+
+        members = frozenset(
+            Conversation.participants.through.objects.filter(
+                conversation_id=conversation_id
+            ).values_list('user_id', flat=True)
+        )
+        # Версии прочитаны до запроса: если участники изменились во время
+        # загрузки, запись не совпадет с новой версией и не будет использована
+        cache.set(
+            self.entry_key(conversation_id),
+            {'versions': versions, 'members': list(members)},
+            self.ttl
+        )
+        return members
+
+    def is_participant(self, conversation_id, user_id):
+        return user_id in self.participants(conversation_id)
+
+    def invalidate(self, conversation_ids):
+        cache.set_many(
+            {self.version_key(conversation_id): uuid.uuid4().hex for conversation_id in conversation_ids},
+            None
+        )
+
+    def clear(self):
+        cache.set(MEMBERS_GENERATION, uuid.uuid4().hex, None)
+
+conversation_members = MembershipCache()
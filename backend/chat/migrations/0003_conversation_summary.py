@@ -0,0 +1,53 @@
+# Generated by Django 4.2 on 2026-10-18 07:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_conversation_summary(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    UnreadCounter = apps.get_model('chat', 'UnreadCounter')
+
+    counters = []
+    for conversation in Conversation.objects.prefetch_related('participants'):
+        last_message = Message.objects.filter(conversation=conversation).order_by('-timestamp', '-id').first()
+        if last_message:
+            Conversation.objects.filter(pk=conversation.pk).update(last_message=last_message)
+        for user in conversation.participants.all():
+            counters.append(UnreadCounter(
+                conversation=conversation,
+                user=user,
+                count=Message.objects.filter(conversation=conversation, is_read=False).exclude(sender=user).count()
+            ))
+    UnreadCounter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0002_alter_conversation_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to='chat.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('conversation', 'user')},
+            },
+        ),
+        migrations.RunPython(fill_conversation_summary, migrations.RunPython.noop),
+    ]
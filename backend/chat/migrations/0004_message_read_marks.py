@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 07:54
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_read_marks(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    UnreadCounter = apps.get_model('chat', 'UnreadCounter')
+
+    for counter in UnreadCounter.objects.all():
+        messages = Message.objects.filter(conversation_id=counter.conversation_id).exclude(sender_id=counter.user_id)
+        last_read = messages.filter(is_read=True).aggregate(last=Max('id'))['last'] or 0
+        counter.last_read_message_id = last_read
+        counter.count = messages.filter(id__gt=last_read).count()
+        counter.save(update_fields=['last_read_message_id', 'count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='unreadcounter',
+            name='last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_read_marks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='chat_message_window_idx'),
+        ),
+    ]
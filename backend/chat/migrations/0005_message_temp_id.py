@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_read_marks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='temp_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('temp_id__isnull', False)), fields=('conversation', 'sender', 'temp_id'), name='chat_message_unique_temp_id'),
+        ),
+    ]
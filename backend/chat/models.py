@@ -17,6 +17,14 @@ class Conversation(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Последнее сообщение диалога, обновляется при создании сообщения (chat.signals)
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True
+    )
     
     class Meta:
         ordering = ['-updated_at']
@@ -43,10 +51,47 @@ class Message(models.Model):
     )
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+    # Временный id сообщения на клиенте: повторная отправка того же сообщения не создает дубликат
+    temp_id = models.CharField(max_length=64, null=True, blank=True)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Окна истории диалога по id (chat.history.message_window)
+            models.Index(fields=['conversation', 'id'], name='chat_message_window_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'sender', 'temp_id'],
+                condition=models.Q(temp_id__isnull=False),
+                name='chat_message_unique_temp_id'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.sender.username}: {self.content[:50]}"
+
+class UnreadCounter(models.Model):
+    """
+    Состояние прочтения диалога участником: граница прочтения
+    last_read_message_id (сообщения с id не больше нее прочитаны)
+    и количество непрочитанных сообщений после нее
+    """
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='unread_counters'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='unread_counters'
+    )
+    count = models.PositiveIntegerField(default=0)
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('conversation', 'user')
     
     def __str__(self):
-        return f"{self.sender.username}: {self.content[:50]}"
\ No newline at end of file
+        return f"{self.user} - диалог #{self.conversation_id}: {self.count}"
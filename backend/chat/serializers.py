@@ -1,23 +1,46 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Conversation, Message
+from .models import Conversation, Message, UnreadCounter
+from .history import is_read, message_window, read_marks
 from users.serializers import UserSerializer
 
 User = get_user_model()
 
+class MessageSenderField(serializers.Field):
+    """
+    Отправитель сообщения. Если в контексте есть словарь senders,
+    каждый пользователь сериализуется один раз на весь ответ
+    """
+    
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+    
+    def to_representation(self, user):
+        senders = self.context.get('senders')
+        if senders is None:
+            return UserSerializer(user, context=self.context).data
+        if user.pk not in senders:
+            senders[user.pk] = UserSerializer(user, context=self.context).data
+        return senders[user.pk]
+
 class MessageSerializer(serializers.ModelSerializer):
-    sender = UserSerializer(read_only=True)
+    sender = MessageSenderField()
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
-        fields = ['id', 'conversation', 'sender', 'content', 'timestamp', 'is_read']
-        read_only_fields = ['timestamp', 'sender', 'conversation']
+        fields = ['id', 'conversation', 'sender', 'content', 'timestamp', 'is_read', 'temp_id']
+        read_only_fields = ['timestamp', 'sender', 'conversation', 'temp_id']
     
     def create(self, validated_data):
         # Автоматически установить отправителя
         validated_data['sender'] = self.context['request'].user
         # Conversation будет установлен в perform_create представления
         return super().create(validated_data)
+    
+    def get_is_read(self, obj):
+        return is_read(obj, self.context.get('read_marks') or {})
 
 class ConversationSerializer(serializers.ModelSerializer):
     participants = UserSerializer(many=True, read_only=True)
@@ -30,7 +53,8 @@ class ConversationSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
     
     def get_last_message(self, obj):
-        last_message = obj.messages.last()
+        # Последнее сообщение хранится в диалоге (ConversationListView загружает его с отправителем)
+        last_message = obj.last_message
         if last_message:
             return {
                 'content': last_message.content,
@@ -40,11 +64,28 @@ class ConversationSerializer(serializers.ModelSerializer):
         return None
     
     def get_unread_count(self, obj):
+        # ConversationListView добавляет счетчик аннотацией unread
+        if hasattr(obj, 'unread'):
+            return obj.unread or 0
         user = self.context['request'].user
-        return obj.messages.filter(is_read=False).exclude(sender=user).count()
+        counter = UnreadCounter.objects.filter(conversation=obj, user=user).values_list('count', flat=True).first()
+        return counter or 0
 
 class ConversationDetailSerializer(ConversationSerializer):
-    messages = MessageSerializer(many=True, read_only=True, source='messages.all')
+    """
+    Диалог с последним окном истории. Более ранние сообщения
+    запрашиваются через MessageListCreateView с параметром before
+    """
+    messages = serializers.SerializerMethodField()
+    has_more_messages = serializers.SerializerMethodField()
     
     class Meta(ConversationSerializer.Meta):
-        fields = ConversationSerializer.Meta.fields + ['messages']
\ No newline at end of file
+        fields = ConversationSerializer.Meta.fields + ['messages', 'has_more_messages']
+    
+    def get_messages(self, obj):
+        messages, self._has_more_messages = message_window(obj)
+        context = {**self.context, 'senders': {}, 'read_marks': read_marks(obj)}
+        return MessageSerializer(messages, many=True, context=context).data
+    
+    def get_has_more_messages(self, obj):
+        return self._has_more_messages
\ No newline at end of file
@@ -1,47 +1,112 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from channels.layers import get_channel_layer
+import logging
+
 from asgiref.sync import async_to_sync
-import json
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 
-from .models import Message, Conversation
-from .serializers import MessageSerializer
+from .models import Message, Conversation, UnreadCounter
+from .history import record_new_messages
+from .dispatch import send_events
+from .membership import conversation_members
+
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=Message)
-def message_created(sender, instance, created, **kwargs):
+def update_conversation_summary(sender, instance, created, **kwargs):
     """
-    Обрабатывает создание нового сообщения и отправляет его по WebSocket
+    Обновляет последнее сообщение диалога и счетчики непрочитанных
+    сообщений остальных участников
     """
     if created:
-        # Создаем сериализатор для сообщения
-        serializer = MessageSerializer(instance)
-        message_data = serializer.data
-        
-        # Получаем группу чата для отправки сообщения
-        conversation_id = str(instance.conversation.id)
-        
-        # Отправляем сообщение в группу чата через WebSocket
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"chat_{conversation_id}",
-            {
-                "type": "chat_message",
-                "message": message_data
-            }
-        )
-        
-        # Также отправляем уведомление всем участникам
-        for participant in instance.conversation.participants.all():
-            if participant != instance.sender:
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{participant.id}",
-                    {
-                        "type": "new_message_notification",
-                        "message": {
-                            "conversation_id": instance.conversation.id,
-                            "sender_name": instance.sender.username,
-                            "content": instance.content[:50] + ('...' if len(instance.content) > 50 else ''),
-                            "timestamp": instance.timestamp.isoformat()
-                        }
-                    }
-                )
\ No newline at end of file
+        record_new_messages([instance])
+
+@receiver(post_delete, sender=Message)
+def remove_from_conversation_summary(sender, instance, **kwargs):
+    """
+    Пересчитывает последнее сообщение диалога и счетчики при удалении сообщения
+    """
+    last_message = Message.objects.filter(
+        conversation_id=instance.conversation_id
+    ).order_by('-timestamp', '-id').first()
+    Conversation.objects.filter(pk=instance.conversation_id).update(last_message=last_message)
+    # Сообщение учтено в счетчиках участников, которые его еще не прочитали
+    UnreadCounter.objects.filter(
+        conversation_id=instance.conversation_id,
+        last_read_message_id__lt=instance.id,
+        count__gt=0
+    ).exclude(user_id=instance.sender_id).update(count=F('count') - 1)
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def update_unread_counters(sender, instance, action, pk_set, **kwargs):
+    """
+    Создает и удаляет счетчики непрочитанных сообщений вместе с участниками диалога
+    """
+    if not isinstance(instance, Conversation):
+        return
+    if action == 'post_add':
+        # Новый участник начинает с прочитанной историей диалога
+        last_message_id = Conversation.objects.filter(pk=instance.pk).values_list(
+            'last_message_id', flat=True
+        ).first()
+        UnreadCounter.objects.bulk_create([
+            UnreadCounter(
+                conversation=instance,
+                user_id=user_id,
+                last_read_message_id=last_message_id or 0
+            )
+            for user_id in pk_set
+        ], ignore_conflicts=True)
+    elif action == 'post_remove':
+        UnreadCounter.objects.filter(conversation=instance, user_id__in=pk_set).delete()
+    elif action == 'post_clear':
+        UnreadCounter.objects.filter(conversation=instance).delete()
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_conversation_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Сбрасывает кэш участников измененных диалогов и участников, которые
+    запомнили открытые ChatConsumer этих диалогов
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        conversation_ids = [instance.pk]
+        groups = [f'chat_{instance.pk}']
+    elif pk_set is not None:
+        # Изменены диалоги пользователя (user.conversations.add/remove)
+        conversation_ids = list(pk_set)
+        groups = [f'chat_{conversation_id}' for conversation_id in conversation_ids]
+    else:
+        # Диалоги пользователя неизвестны: сбрасывается весь кэш, а его
+        # соединения получают событие через персональную группу
+        conversation_ids = None
+        groups = [f'user_{instance.pk}']
+
+    def invalidate():
+        if conversation_ids is None:
+            conversation_members.clear()
+        else:
+            conversation_members.invalidate(conversation_ids)
+        notify_members_changed(groups)
+
+    # Сброс после фиксации: участники, загруженные до нее, не останутся в кэше
+    transaction.on_commit(invalidate)
+
+@receiver(post_delete, sender=Conversation)
+def forget_conversation_members(sender, instance, **kwargs):
+    conversation_id = instance.pk
+
+    def invalidate():
+        conversation_members.invalidate([conversation_id])
+        notify_members_changed([f'chat_{conversation_id}'])
+
+    transaction.on_commit(invalidate)
+
+def notify_members_changed(groups):
+    """Сообщает открытым ChatConsumer в группах groups, что участники изменились"""
+    try:
+        async_to_sync(send_events)([(group, {'type': 'members_changed'}) for group in groups])
+    except Exception as e:
+        logger.exception(f"Error broadcasting chat membership change: {str(e)}")
@@ -0,0 +1,220 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from .dispatch import dispatch_message
+from .history import is_read, mark_read, read_marks
+from .ingest import MessageIngestBuffer
+from .membership import conversation_members
+from .models import Conversation, Message, UnreadCounter
+from .routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+def create_conversation(*participants):
+    """Диалог с участниками participants"""
+    conversation = Conversation.objects.create()
+    conversation.participants.add(*participants)
+    return conversation
+
+
+class ChatTestCase(TestCase):
+    """Продавец и покупатель; сообщения отправляются с выполнением on_commit"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+
+    def send(self, conversation, sender, content, temp_id=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return dispatch_message(conversation, sender, content, temp_id=temp_id)
+
+    def counter(self, conversation, user):
+        return UnreadCounter.objects.get(conversation=conversation, user=user)
+
+
+class ConversationListQueryTests(ChatTestCase):
+    """Список диалогов строится постоянным числом запросов"""
+
+    def test_query_count_does_not_grow_with_conversations(self):
+        self.client.force_login(self.buyer)
+        url = reverse('chat:conversation-list')
+        for conversations in (1, 9):
+            for index in range(conversations):
+                seller = User.objects.create_user(
+                    f'seller{conversations}_{index}', f'seller{conversations}_{index}@example.com', 'password'
+                )
+                self.send(create_conversation(self.buyer, seller), seller, 'Здравствуйте')
+            # Сессия, пользователь, диалоги с последним сообщением и счетчиком, участники с профилями
+            with self.subTest(conversations=conversations), self.assertNumQueries(5):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), Conversation.objects.count())
+            self.assertTrue(all(conversation['unread_count'] == 1 for conversation in response.data))
+
+
+class ReadMarkTests(ChatTestCase):
+    """Счетчики непрочитанных сообщений и границы прочтения"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = create_conversation(self.seller, self.buyer)
+
+    def test_new_messages_count_for_other_participants(self):
+        self.send(self.conversation, self.seller, 'Первое')
+        self.send(self.conversation, self.seller, 'Второе')
+        self.assertEqual(self.counter(self.conversation, self.buyer).count, 2)
+        self.assertEqual(self.counter(self.conversation, self.seller).count, 0)
+
+    def test_mark_read_moves_read_mark(self):
+        first, _ = self.send(self.conversation, self.seller, 'Первое')
+        self.send(self.conversation, self.seller, 'Второе')
+        self.conversation.refresh_from_db()
+
+        mark_read(self.conversation, self.buyer, first['id'])
+        counter = self.counter(self.conversation, self.buyer)
+        self.assertEqual((counter.last_read_message_id, counter.count), (first['id'], 1))
+
+        mark_read(self.conversation, self.buyer)
+        counter = self.counter(self.conversation, self.buyer)
+        self.assertEqual((counter.last_read_message_id, counter.count), (self.conversation.last_message_id, 0))
+
+        message = Message.objects.get(pk=first['id'])
+        self.assertTrue(is_read(message, read_marks(self.conversation)))
+
+    def test_read_mark_cannot_pass_last_message(self):
+        self.send(self.conversation, self.seller, 'Первое')
+        self.client.force_login(self.buyer)
+        response = self.client.post(
+            reverse('chat:conversation-read', args=[self.conversation.pk]), {'message_id': 10 ** 9}
+        )
+        self.conversation.refresh_from_db()
+        self.assertEqual(response.data['last_read_message_id'], self.conversation.last_message_id)
+
+        # Следующее сообщение не считается прочитанным заранее
+        later, _ = self.send(self.conversation, self.seller, 'Второе')
+        self.assertFalse(is_read(Message.objects.get(pk=later['id']), read_marks(self.conversation)))
+        self.assertEqual(self.counter(self.conversation, self.buyer).count, 1)
+
+
+class TempIdTests(ChatTestCase):
+    """Повторная отправка сообщения с тем же temp_id"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = create_conversation(self.seller, self.buyer)
+
+    def test_dispatch_message_returns_stored_message(self):
+        with self.captureOnCommitCallbacks() as broadcasts:
+            first, created = dispatch_message(self.conversation, self.buyer, 'Привет', temp_id='tmp-1')
+            again, created_again = dispatch_message(self.conversation, self.buyer, 'Привет', temp_id='tmp-1')
+        self.assertEqual((created, created_again), (True, False))
+        self.assertEqual(first['id'], again['id'])
+        self.assertEqual(Message.objects.count(), 1)
+        # Рассылается только созданное сообщение
+        self.assertEqual(len(broadcasts), 1)
+
+    def test_ingest_batch_writes_temp_id_once(self):
+        buffer = MessageIngestBuffer()
+        self.send(self.conversation, self.buyer, 'Привет', temp_id='tmp-1')
+        results, events = buffer.write([
+            (self.conversation.pk, self.buyer, 'Привет', 'tmp-1'),
+            (self.conversation.pk, self.buyer, 'Как дела?', 'tmp-2'),
+            (self.conversation.pk, self.buyer, 'Как дела?', 'tmp-2'),
+        ])
+        self.assertEqual([created for data, created in results], [False, True, False])
+        self.assertEqual(results[1][0]['id'], results[2][0]['id'])
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(self.counter(self.conversation, self.seller).count, 2)
+        # Сообщение в диалог и уведомление продавцу - только для нового сообщения
+        self.assertEqual(len(events), 2)
+
+
+class IngestFailureTests(TransactionTestCase):
+    """Ошибка одного сообщения пачки не влияет на остальные"""
+
+    def test_failed_message_rejects_only_its_sender(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        conversation = create_conversation(seller, buyer)
+        deleted = create_conversation(seller, buyer)
+        deleted_id = deleted.pk
+        deleted.delete()
+        buffer = MessageIngestBuffer()
+
+        async def submit_batch():
+            return await asyncio.gather(
+                buffer.submit(conversation.pk, buyer, 'Привет', 'tmp-1'),
+                buffer.submit(deleted_id, buyer, 'Удаленный диалог', 'tmp-2'),
+                buffer.submit(conversation.pk, buyer, 'Без temp_id'),
+                return_exceptions=True
+            )
+
+        with self.assertLogs('chat.ingest', level='ERROR'):
+            first, failed, last = async_to_sync(submit_batch)()
+        self.assertIsInstance(failed, Exception)
+        self.assertEqual((first[1], last[1]), (True, True))
+        self.assertEqual(
+            list(Message.objects.order_by('id').values_list('content', flat=True)),
+            ['Привет', 'Без temp_id']
+        )
+
+
+class MembershipCacheTests(ChatTestCase):
+    """Кэш участников диалогов сбрасывается при изменении участников"""
+
+    def test_participants_follow_m2m_changes(self):
+        conversation = create_conversation(self.seller)
+        self.assertEqual(conversation_members.participants(conversation.pk), {self.seller.id})
+        with self.assertNumQueries(0):
+            self.assertFalse(conversation_members.is_participant(conversation.pk, self.buyer.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            conversation.participants.add(self.buyer)
+        self.assertEqual(conversation_members.participants(conversation.pk), {self.seller.id, self.buyer.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buyer.conversations.remove(conversation)
+        self.assertEqual(conversation_members.participants(conversation.pk), {self.seller.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.conversations.clear()
+        self.assertEqual(conversation_members.participants(conversation.pk), set())
+
+
+class ChatConsumerMembershipTests(TransactionTestCase):
+    """ChatConsumer проверяет участников в памяти до изменения состава диалога"""
+
+    def test_removed_participant_is_disconnected(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        conversation = create_conversation(seller, buyer)
+
+        async def chat():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), f'/ws/chat/{conversation.pk}/'
+            )
+            communicator.scope['user'] = buyer
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await communicator.send_json_to({'type': 'ping'})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'pong')
+
+            await database_sync_to_async(conversation.participants.remove)(buyer)
+            await communicator.send_json_to({'type': 'message', 'content': 'Привет'})
+            output = await communicator.receive_output()
+            await communicator.disconnect()
+            return output
+
+        self.assertEqual(async_to_sync(chat)(), {'type': 'websocket.close', 'code': 4003})
+        self.assertFalse(Message.objects.exists())
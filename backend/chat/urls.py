@@ -6,7 +6,8 @@ app_name = 'chat'
 urlpatterns = [
     path('conversations/', views.ConversationListView.as_view(), name='conversation-list'),
     path('conversations/<int:pk>/', views.ConversationDetailView.as_view(), name='conversation-detail'),
-    path('conversations/<int:conversation_id>/messages/', views.MessageCreateView.as_view(), name='message-create'),
+    path('conversations/<int:pk>/read/', views.mark_conversation_read, name='conversation-read'),
+    path('conversations/<int:conversation_id>/messages/', views.MessageListCreateView.as_view(), name='message-create'),
     
     # Стандартный путь для создания диалога по ID автомобиля
     path('cars/<int:car_id>/start-conversation/', views.start_conversation, name='start-conversation'),
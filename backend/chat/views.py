@@ -1,18 +1,22 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
-from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from django.db.models import Q, OuterRef, Subquery
 from django.shortcuts import get_object_or_404
 
-from .models import Conversation, Message
+from .models import Conversation, UnreadCounter
 from .serializers import ConversationSerializer, ConversationDetailSerializer, MessageSerializer
+from .dispatch import dispatch_message
+from .membership import conversation_members
+from .history import message_window, read_marks, mark_read, MESSAGE_WINDOW, MAX_MESSAGE_WINDOW
 from auction.models import Car
 
 class IsParticipant(permissions.BasePermission):
     """Разрешение для проверки, является ли пользователь участником диалога"""
     
     def has_object_permission(self, request, view, obj):
-        return obj.participants.filter(id=request.user.id).exists()
+        return conversation_members.is_participant(obj.pk, request.user.id)
 
 class ConversationListView(generics.ListAPIView):
     """Получение списка диалогов пользователя"""
@@ -21,8 +25,17 @@ class ConversationListView(generics.ListAPIView):
     
     def get_queryset(self):
         user = self.request.user
+        # Последнее сообщение и счетчик непрочитанных хранятся отдельно,
+        # поэтому список строится постоянным числом запросов
+        unread = UnreadCounter.objects.filter(conversation=OuterRef('pk'), user=user).values('count')[:1]
         # Используем distinct для исключения дублирования диалогов
-        return Conversation.objects.filter(participants=user).distinct().order_by('-updated_at')
+        return Conversation.objects.filter(participants=user).distinct().select_related(
+            'last_message__sender'
+        ).prefetch_related(
+            'participants__profile'
+        ).annotate(
+            unread=Subquery(unread)
+        ).order_by('-updated_at')
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -54,42 +67,96 @@ class ConversationDetailView(generics.RetrieveAPIView):
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         
-        # Отметить все сообщения в диалоге как прочитанные для текущего пользователя
-        Message.objects.filter(
-            conversation=instance,
-            is_read=False
-        ).exclude(sender=request.user).update(is_read=True)
+        # Отметить все сообщения в диалоге как прочитанные для текущего пользователя:
+        # сдвигается граница прочтения, сами сообщения не обновляются
+        mark_read(instance, request.user)
         
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
-class MessageCreateView(generics.CreateAPIView):
-    """Создание нового сообщения в диалоге"""
+def _message_id_param(request, name):
+    value = request.query_params.get(name) if request.method == 'GET' else request.data.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({'error': f'Параметр {name} должен быть целым числом'})
+
+class MessageListCreateView(generics.ListCreateAPIView):
+    """
+    Окно истории сообщений диалога (GET) и создание нового сообщения (POST).
+
+    GET принимает before или after - id сообщения, от которого
+    отсчитывается окно, и limit. Без параметров возвращаются
+    последние сообщения.
+    """
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_conversation(self):
+        conversation = get_object_or_404(Conversation, id=self.kwargs.get('conversation_id'))
+        if not conversation_members.is_participant(conversation.pk, self.request.user.id):
+            self.permission_denied(self.request, message="Вы не являетесь участником этого диалога.")
+        return conversation
+    
+    def list(self, request, *args, **kwargs):
+        conversation = self.get_conversation()
+        before = _message_id_param(request, 'before')
+        after = _message_id_param(request, 'after')
+        limit = _message_id_param(request, 'limit') or MESSAGE_WINDOW
+        if before is not None and after is not None:
+            raise ValidationError({'error': 'Укажите только один из параметров before и after'})
+        
+        messages, has_more = message_window(
+            conversation,
+            before=before,
+            after=after,
+            limit=max(1, min(limit, MAX_MESSAGE_WINDOW))
+        )
+        context = {**self.get_serializer_context(), 'senders': {}, 'read_marks': read_marks(conversation)}
+        return Response({
+            'results': MessageSerializer(messages, many=True, context=context).data,
+            'has_more': has_more,
+        })
+    
     def get_serializer_context(self):
         context = super().get_serializer_context()
         return context
     
-    def perform_create(self, serializer):
-        conversation_id = self.kwargs.get('conversation_id')
-        conversation = get_object_or_404(Conversation, id=conversation_id)
-        
+    def create(self, request, *args, **kwargs):
         # Проверка, является ли пользователь участником диалога
-        if not conversation.participants.filter(id=self.request.user.id).exists():
-            return Response(
-                {"error": "Вы не являетесь участником этого диалога."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-        
-        # Сохраняем сообщение, добавляя conversation без требования его из запроса
-        message = serializer.save(conversation=conversation, sender=self.request.user)
+        conversation = self.get_conversation()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        # Обновить дату последнего сообщения
-        conversation.save()  # Это обновит auto_now поле
-        
-        return message
+        # Сообщение сохраняется и рассылается участникам через общий конвейер,
+        # повторный запрос с тем же temp_id возвращает уже созданное сообщение
+        message_data, created = dispatch_message(
+            conversation,
+            request.user,
+            serializer.validated_data['content'],
+            temp_id=request.data.get('temp_id')
+        )
+        return Response(message_data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def mark_conversation_read(request, pk):
+    """Сдвигает границу прочтения диалога до message_id (по умолчанию - до последнего сообщения)"""
+    conversation = get_object_or_404(Conversation, id=pk)
+    if not conversation_members.is_participant(conversation.pk, request.user.id):
+        return Response(
+            {"error": "Вы не являетесь участником этого диалога."},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    mark_read(conversation, request.user, _message_id_param(request, 'message_id'))
+    counter = UnreadCounter.objects.filter(conversation=conversation, user=request.user).first()
+    return Response({
+        'last_read_message_id': counter.last_read_message_id if counter else 0,
+        'unread_count': counter.count if counter else 0,
+    })
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -143,10 +210,10 @@ def start_conversation(request, car_id):
         conversation.save()
         
         # Добавляем сообщение о новом автомобиле
-        Message.objects.create(
-            conversation=conversation,
-            sender=user,
-            content=f"Обсуждение аукциона: {car.brand} {car.model} ({car.year})"
+        dispatch_message(
+            conversation,
+            user,
+            f"Обсуждение аукциона: {car.brand} {car.model} ({car.year})"
         )
         
         serializer = ConversationDetailSerializer(conversation, context={'request': request})
@@ -161,10 +228,10 @@ def start_conversation(request, car_id):
         conversation.participants.add(seller)
     
     # Добавляем первое сообщение в диалог
-    Message.objects.create(
-        conversation=conversation,
-        sender=user,
-        content=f"Обсуждение аукциона: {car.brand} {car.model} ({car.year})"
+    dispatch_message(
+        conversation,
+        user,
+        f"Обсуждение аукциона: {car.brand} {car.model} ({car.year})"
     )
     
     serializer = ConversationDetailSerializer(conversation, context={'request': request})
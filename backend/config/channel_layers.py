@@ -0,0 +1,260 @@
+import asyncio
+import atexit
+import base64
+import errno
+import json
+import logging
+import os
+import random
+import socket
+import string
+import time
+import weakref
+
+from channels.layers import InMemoryChannelLayer
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(payload):
+    def default(value):
+        if isinstance(value, (bytes, bytearray)):
+            return {'__bytes__': base64.b64encode(value).decode('ascii')}
+        return str(value)
+    return json.dumps(payload, default=default, separators=(',', ':')).encode()
+
+
+def _decode(data):
+    def object_hook(value):
+        if len(value) == 1 and '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        return value
+    return json.loads(data, object_hook=object_hook)
+
+
+class LocalSocketChannelLayer(InMemoryChannelLayer):
+    """
+    Слой каналов для нескольких ASGI-процессов на одном хосте без Redis.
+
+    Каждый процесс хранит свои каналы и группы в памяти, как
+    InMemoryChannelLayer, и слушает unix-сокет в каталоге socket_dir.
+    group_send доставляет сообщение локальным участникам группы и рассылает
+    его одной датаграммой каждому другому процессу, который доставляет его
+    своим участникам. Имя канала содержит идентификатор процесса-владельца,
+    поэтому send в чужой канал уходит напрямую в сокет этого процесса.
+    Процессы, которые только отправляют сообщения (WSGI, команды manage.py),
+    собственный сокет не создают.
+
+    Датаграммы не теряются при заполненной очереди получателя
+    (net.unix.max_dgram_qlen, по умолчанию 10): отправка ждет, пока
+    получатель не вычитает очередь, и сохраняет порядок сообщений каждому
+    процессу. Сообщение теряется, только если получатель не читает дольше
+    send_timeout секунд.
+    """
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, socket_dir='/tmp/autoauction-channels', peer_refresh=1.0, send_timeout=5.0, **kwargs):
+        super().__init__(**kwargs)
+        self.socket_dir = socket_dir
+        self.peer_refresh = peer_refresh
+        self.send_timeout = send_timeout
+        self.process_name = 'p%d-%s' % (
+            os.getpid(),
+            ''.join(random.choice(string.ascii_letters) for _ in range(6)),
+        )
+        self.socket_path = os.path.join(socket_dir, f'{self.process_name}.sock')
+        self._listener = None
+        # Сокеты, подключенные к получателям: только у подключенного сокета
+        # готовность к записи зависит от очереди получателя
+        self._senders = {}
+        # Блокировки отправки по получателям для каждого цикла событий
+        self._send_locks = weakref.WeakKeyDictionary()
+        self._deliveries = set()
+        self._peers = []
+        self._peers_checked = 0
+
+    # Channel layer API
+
+    async def new_channel(self, prefix="specific."):
+        self._ensure_listening()
+        return "%s%s!%s" % (
+            prefix,
+            self.process_name,
+            "".join(random.choice(string.ascii_letters) for i in range(12)),
+        )
+
+    async def send(self, channel, message):
+        owner = self._channel_owner(channel)
+        if owner is None or owner == self.process_name:
+            await super().send(channel, message)
+            return
+        assert isinstance(message, dict), "message is not a dict"
+        await self._send_datagram(
+            os.path.join(self.socket_dir, f'{owner}.sock'),
+            _encode({'op': 'send', 'channel': channel, 'message': message}),
+        )
+
+    async def group_add(self, group, channel):
+        self._ensure_listening()
+        await super().group_add(group, channel)
+
+    async def group_send(self, group, message):
+        await super().group_send(group, message)
+        # Сообщение кодируется один раз для всех процессов
+        data = _encode({'op': 'group_send', 'group': group, 'message': message})
+        # Медленный получатель не задерживает доставку остальным процессам
+        await asyncio.gather(*(
+            self._send_datagram(path, data) for path in list(self._peer_sockets())
+        ))
+
+    async def close(self):
+        self._stop_listening()
+        for sender in self._senders.values():
+            sender.close()
+        self._senders.clear()
+
+    # Process-to-process transport
+
+    def _channel_owner(self, channel):
+        non_local = self.non_local_name(channel)
+        if not non_local.endswith('!'):
+            return None
+        # Имя процесса - последний сегмент перед "!"
+        return non_local[:-1].rsplit('.', 1)[-1] or None
+
+    def _ensure_listening(self):
+        if self._listener is not None:
+            return
+        loop = asyncio.get_running_loop()
+        os.makedirs(self.socket_dir, mode=0o700, exist_ok=True)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        listener.setblocking(False)
+        listener.bind(self.socket_path)
+        loop.add_reader(listener.fileno(), self._on_datagram)
+        self._listener = listener
+        self._listener_loop = loop
+        atexit.register(self._stop_listening)
+
+    def _stop_listening(self):
+        if self._listener is None:
+            return
+        try:
+            self._listener_loop.remove_reader(self._listener.fileno())
+        except Exception:
+            pass
+        self._listener.close()
+        self._listener = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def _on_datagram(self):
+        while self._listener is not None:
+            try:
+                data = self._listener.recv(self._max_datagram())
+            except BlockingIOError:
+                return
+            try:
+                packet = _decode(data)
+            except ValueError:
+                logger.warning("Dropping malformed channel layer datagram")
+                continue
+            if packet['op'] == 'group_send':
+                coroutine = InMemoryChannelLayer.group_send(self, packet['group'], packet['message'])
+            else:
+                coroutine = InMemoryChannelLayer.send(self, packet['channel'], packet['message'])
+            # Ссылка на задачу хранится до ее завершения
+            task = asyncio.ensure_future(self._deliver(coroutine))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, coroutine):
+        try:
+            await coroutine
+        except Exception as e:
+            # Переполненный канал теряет сообщение, как и в InMemoryChannelLayer
+            logger.debug(f"Dropped channel layer message: {str(e)}")
+
+    def _peer_sockets(self):
+        now = time.monotonic()
+        if now - self._peers_checked >= self.peer_refresh:
+            try:
+                self._peers = [
+                    entry.path for entry in os.scandir(self.socket_dir)
+                    if entry.name.endswith('.sock') and entry.path != self.socket_path
+                ]
+            except FileNotFoundError:
+                self._peers = []
+            self._peers_checked = now
+        return self._peers
+
+    async def _send_datagram(self, path, data):
+        loop = asyncio.get_running_loop()
+        locks = self._send_locks.setdefault(loop, {})
+        lock = locks.setdefault(path, asyncio.Lock())
+        # Сообщения одному процессу отправляются по очереди, в порядке вызова
+        async with lock:
+            deadline = loop.time() + self.send_timeout
+            while True:
+                try:
+                    self._sender_for(path).send(data)
+                    return
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Процесс-получатель завершился, не удалив сокет
+                    self._forget_peer(path)
+                    return
+                except BlockingIOError:
+                    # Очередь получателя заполнена: ждем, пока он ее вычитает
+                    if not await self._wait_writable(self._senders[path], deadline):
+                        logger.warning(f"Channel layer peer {path} is not reading, message dropped")
+                        return
+                except OSError as e:
+                    if e.errno != errno.EMSGSIZE:
+                        raise
+                    logger.error(f"Channel layer message of {len(data)} bytes is too large for {path}")
+                    return
+
+    def _sender_for(self, path):
+        sender = self._senders.get(path)
+        if sender is None:
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sender.setblocking(False)
+            try:
+                sender.connect(path)
+            except OSError:
+                sender.close()
+                raise
+            self._senders[path] = sender
+        return sender
+
+    async def _wait_writable(self, sender, deadline):
+        """Ждет готовности подключенного сокета к записи, False по истечении deadline"""
+        loop = asyncio.get_running_loop()
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            return False
+        writable = loop.create_future()
+        loop.add_writer(sender.fileno(), lambda: writable.done() or writable.set_result(None))
+        try:
+            await asyncio.wait_for(writable, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_writer(sender.fileno())
+
+    def _forget_peer(self, path):
+        sender = self._senders.pop(path, None)
+        if sender is not None:
+            sender.close()
+        if path in self._peers:
+            self._peers.remove(path)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _max_datagram(self):
+        return self._listener.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
@@ -1,9 +1,12 @@
-import jwt
+import time
+import uuid
 import logging
+from urllib.parse import parse_qs
 from channels.db import database_sync_to_async
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
@@ -12,20 +15,82 @@ User = get_user_model()
 # Настройка логгера
 logger = logging.getLogger('django')
 
+# Поколение всего кэша пользователей WebSocket
+TOKEN_USERS_GENERATION = 'ws_users_gen'
+
+class TokenUserCache:
+    """
+    Кэш пользователей WebSocket-соединений по jti токена в общем кэше Django.
+
+    Запись живет не дольше ttl секунд и не дольше срока действия токена и
+    хранится вместе с версией пользователя и поколением кэша - случайными
+    метками, как в chat.membership. invalidate_user (выход, блокировка
+    токена, изменение учетной записи) меняет версию пользователя во всех
+    процессах сразу, и его записи перестают использоваться.
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+
+    def entry_key(self, jti):
+        return f'ws_user:{jti}'
+
+    def version_key(self, user_id):
+        return f'ws_user_version:{user_id}'
+
+    def _versions(self, jti, user_id):
+        """Запись кэша и текущие (версия пользователя, поколение) одним запросом к кэшу"""
+        keys = [self.entry_key(jti), self.version_key(user_id), TOKEN_USERS_GENERATION]
+        values = cache.get_many(keys)
+        missing = [key for key in keys[1:] if key not in values]
+        if missing:
+            for key in missing:
+                cache.add(key, uuid.uuid4().hex, None)
+            values.update(cache.get_many(missing))
+        return values.get(keys[0]), (values.get(keys[1]), values.get(keys[2]))
+
+    def user(self, jti, user_id, token_exp):
+        """Пользователь токена, при промахе загружается одним запросом"""
+        entry, versions = self._versions(jti, user_id)
+        if entry is not None and entry['versions'] == versions:
+            return entry['user']
+
+        user = User.objects.get(id=user_id)
+        timeout = int(min(self.ttl, token_exp - time.time()))
+        if timeout > 0:
+            # Версии прочитаны до запроса: изменение пользователя во время
+            # загрузки делает запись недействительной
+            cache.set(self.entry_key(jti), {'versions': versions, 'user': user}, timeout)
+        return user
+
+    def invalidate_user(self, user_id):
+        cache.set(self.version_key(user_id), uuid.uuid4().hex, None)
+
+    def clear(self):
+        cache.set(TOKEN_USERS_GENERATION, uuid.uuid4().hex, None)
+
+token_user_cache = TokenUserCache()
+
 @database_sync_to_async
-def get_user(token_key):
+def fetch_user(user_id, jti=None, token_exp=None):
+    if jti is None:
+        return User.objects.get(id=user_id)
+    return token_user_cache.user(jti, user_id, token_exp)
+
+async def get_user(token_key):
     """
-    Асинхронная функция для получения пользователя по JWT токену
+    Асинхронная функция для получения пользователя по JWT токену.
+    Токен проверяется один раз, пользователь берется из общего кэша по jti,
+    база данных запрашивается только для новых токенов и после изменения
+    пользователя.
     """
     try:
-        # Пытаемся декодировать JWT токен
-        UntypedToken(token_key)
-        decoded_data = jwt.decode(token_key, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id = decoded_data.get('user_id')
+        # Проверяем подпись и срок действия токена
+        token = UntypedToken(token_key)
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+        jti = token.get(api_settings.JTI_CLAIM)
         
-        # Получаем пользователя
         if user_id:
-            user = User.objects.get(id=user_id)
+            user = await fetch_user(user_id, jti, token['exp'])
             logger.info(f"Successfully authenticated user {user.username} (ID: {user.id}) via WebSocket")
             return user
     except InvalidToken as e:
@@ -34,8 +99,6 @@ def get_user(token_key):
         logger.warning(f"JWT token error: {str(e)}")
     except User.DoesNotExist as e:
         logger.warning(f"User from JWT token not found: {str(e)}")
-    except jwt.PyJWTError as e:
-        logger.warning(f"JWT decoding error: {str(e)}")
     except Exception as e:
         logger.error(f"Unexpected error during WebSocket authentication: {str(e)}")
     
@@ -58,16 +121,9 @@ class JWTAuthMiddleware:
         
         # Получаем токен из параметров запроса
         query_string = scope.get('query_string', b'').decode()
-        query_params = {}
-        
-        # Безопасно парсим параметры запроса
-        try:
-            if query_string:
-                query_params = dict(param.split('=') for param in query_string.split('&') if param and '=' in param)
-        except Exception as e:
-            logger.warning(f"Error parsing query string: {str(e)}")
+        query_params = parse_qs(query_string)
         
-        token = query_params.get('token', None)
+        token = query_params.get('token', [None])[0]
         
         # Если токен найден в запросе, логируем это
         if token:
@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import logging
+import time
+import weakref
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# Счетчики исходящих очередей всех сокетов процесса
+outbound_metrics = Counter()
+_connections = weakref.WeakSet()
+
+
+def outbound_stats():
+    """Снимок метрик исходящих очередей WebSocket текущего процесса"""
+    consumers = list(_connections)
+    depths = [len(consumer._outbound) for consumer in consumers]
+    buffered = [consumer.outbound_buffered_bytes() or 0 for consumer in consumers]
+    return {
+        'connections': len(depths),
+        'queued_messages': sum(depths),
+        'max_depth': max(depths, default=0),
+        'buffered_bytes': sum(buffered),
+        'max_buffered_bytes': max(buffered, default=0),
+        'stalled_connections': sum(
+            1 for consumer in consumers if consumer._outbound_stalled_since is not None
+        ),
+        'slow_connections': sum(
+            1 for consumer in consumers if consumer._outbound_full_since is not None
+        ),
+        **{
+            name: outbound_metrics[name]
+            for name in ('queued', 'sent', 'coalesced', 'dropped', 'stalled', 'evicted')
+        },
+    }
+
+
+def transport_buffered_bytes(send):
+    """
+    Количество байт, записанных в транспорт сервера, но еще не отправленных
+    клиенту, или None, если сервер не дает доступа к транспорту.
+
+    Daphne передает приложению send = partial(Server.handle_reply, protocol),
+    транспорт протокола - TCP-транспорт Twisted (при TLS - обертка над ним).
+    Для asyncio-серверов используется get_write_buffer_size.
+    """
+    if not isinstance(send, functools.partial) or not send.args:
+        return None
+    transport = getattr(send.args[0], 'transport', None)
+    for _ in range(2):
+        if transport is None:
+            return None
+        if hasattr(transport, 'get_write_buffer_size'):
+            return transport.get_write_buffer_size()
+        if hasattr(transport, 'dataBuffer'):
+            # twisted.internet.abstract.FileDescriptor: dataBuffer с offset - данные,
+            # ожидающие записи в сокет, _tempDataLen - данные, накопленные write()
+            # до следующего doWrite. Атрибут внутренний, поэтому при его
+            # отсутствии учитывается только dataBuffer
+            pending = len(transport.dataBuffer) - getattr(transport, 'offset', 0)
+            return pending + getattr(transport, '_tempDataLen', 0)
+        transport = getattr(transport, 'transport', None)
+    return None
+
+
+class OutboundQueueMixin:
+    """
+    Ограниченная исходящая очередь для AsyncWebsocketConsumer.
+
+    Обработчики событий группы кладут кадры в очередь через queue_send
+    и сразу возвращаются, поэтому медленный клиент не задерживает
+    разбор канала и не переполняет слой каналов. Кадры отправляет
+    отдельная задача в порядке поступления.
+
+    send() сервера не ждет клиента: Daphne сразу пишет кадр в буфер
+    транспорта Twisted. Поэтому задача отправки перед каждым кадром
+    проверяет размер этого буфера и, если он больше outbound_high_water
+    байт, ждет, пока клиент не вычитает его до outbound_low_water.
+    Пока клиент не читает, кадры копятся в очереди.
+
+    Кадр с key (снимок состояния), еще не отправленный клиенту, заменяется
+    новым кадром с тем же key. droppable-кадры (счетчики зрителей) можно
+    потерять: при заполнении очереди вытесняется самый старый такой кадр.
+    Остальные кадры (ставки, состояние аукциона, уведомления, сообщения
+    чата) не теряются. Если буфер транспорта не освобождается дольше
+    outbound_slow_timeout секунд, очередь остается заполненной столько же
+    или вырастает вдвое сверх лимита, соединение закрывается с кодом 4008.
+    """
+
+    outbound_max_depth = 100
+    outbound_high_water = 256 * 1024
+    outbound_low_water = 64 * 1024
+    outbound_drain_interval = 0.05
+    outbound_slow_timeout = 30.0
+    outbound_close_code = 4008
+
+    _outbound_stalled_since = None
+    _outbound_full_since = None
+
+    def outbound_buffered_bytes(self):
+        return transport_buffered_bytes(getattr(self, 'base_send', None))
+
+    async def queue_send(self, text_data, droppable=False, key=None):
+        if getattr(self, '_outbound_closed', False):
+            return
+        if not hasattr(self, '_outbound'):
+            self._start_outbound()
+        queue = self._outbound
+        outbound_metrics['queued'] += 1
+
+        if key is not None and key in self._outbound_keys:
+            # Клиент еще не получил предыдущий кадр, отправляем только свежий
+            self._outbound_keys[key][2] = text_data
+            outbound_metrics['coalesced'] += 1
+            return
+
+        if len(queue) >= self.outbound_max_depth:
+            if self._outbound_full_since is None:
+                self._outbound_full_since = time.monotonic()
+            stale = next((entry for entry in queue if entry[1]), None)
+            if stale is not None:
+                queue.remove(stale)
+                self._outbound_keys.pop(stale[0], None)
+                outbound_metrics['dropped'] += 1
+            elif droppable:
+                outbound_metrics['dropped'] += 1
+                return
+
+            if len(queue) >= 2 * self.outbound_max_depth or \
+                    time.monotonic() - self._outbound_full_since > self.outbound_slow_timeout:
+                await self._evict_slow_consumer()
+                return
+
+        entry = [key, droppable, text_data]
+        queue.append(entry)
+        if key is not None:
+            self._outbound_keys[key] = entry
+        self._outbound_ready.set()
+
+    def _start_outbound(self):
+        self._outbound = deque()
+        self._outbound_keys = {}
+        self._outbound_ready = asyncio.Event()
+        self._outbound_task = asyncio.ensure_future(self._outbound_writer())
+        _connections.add(self)
+
+    def _stop_outbound(self):
+        self._outbound_closed = True
+        if hasattr(self, '_outbound'):
+            # Задача отправки может сама закрывать соединение
+            if self._outbound_task is not asyncio.current_task():
+                self._outbound_task.cancel()
+            self._outbound.clear()
+            self._outbound_keys.clear()
+            _connections.discard(self)
+
+    async def _outbound_writer(self):
+        queue = self._outbound
+        while True:
+            while not queue:
+                self._outbound_ready.clear()
+                await self._outbound_ready.wait()
+            if not await self._wait_for_drain():
+                return
+            key, droppable, text_data = queue.popleft()
+            if key is not None:
+                self._outbound_keys.pop(key, None)
+            if len(queue) < self.outbound_max_depth // 2:
+                self._outbound_full_since = None
+            try:
+                await self.send(text_data=text_data)
+                outbound_metrics['sent'] += 1
+            except Exception as e:
+                logger.error(f"Error sending queued WebSocket message: {str(e)}")
+
+    async def _wait_for_drain(self):
+        """
+        Ждет, пока клиент не вычитает буфер транспорта. Возвращает False,
+        если соединение закрыто как медленное
+        """
+        buffered = self.outbound_buffered_bytes()
+        if buffered is None or buffered < self.outbound_high_water:
+            return True
+
+        self._outbound_stalled_since = time.monotonic()
+        outbound_metrics['stalled'] += 1
+        try:
+            while True:
+                await asyncio.sleep(self.outbound_drain_interval)
+                buffered = self.outbound_buffered_bytes()
+                if buffered is None or buffered <= self.outbound_low_water:
+                    return True
+                if time.monotonic() - self._outbound_stalled_since > self.outbound_slow_timeout:
+                    await self._evict_slow_consumer()
+                    return False
+        finally:
+            self._outbound_stalled_since = None
+
+    async def _evict_slow_consumer(self):
+        outbound_metrics['evicted'] += 1
+        logger.warning(
+            f"Closing slow WebSocket consumer {self.channel_name}: "
+            f"{len(self._outbound)} messages queued, "
+            f"{self.outbound_buffered_bytes() or 0} bytes buffered"
+        )
+        self._stop_outbound()
+        await self.close(code=self.outbound_close_code)
+
+    async def websocket_disconnect(self, message):
+        self._stop_outbound()
+        await super().websocket_disconnect(message)
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -22,6 +23,9 @@ except ImportError:
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# manage.py test: тесты не должны писать в сокеты и кэш запущенного сервера
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY',
                        'django-insecure-key-for-development-only')
@@ -103,18 +107,14 @@ TEMPLATES = [
 
 ASGI_APPLICATION = 'config.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
-    }
-}
-ASGI_APPLICATION = 'config.asgi.application'
-
 # Database
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Тестовая БД в файле, а не в памяти: блокировки записи работают как
+        # в рабочей БД, и тесты одновременных ставок ждут их, а не падают
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -196,11 +196,57 @@ CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = CSRF_TRUSTED_ORIGINS  # Ensure CORS origins match CSRF trusted origins
 
 # Channels settings
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+# Слой каналов local_socket рассылает групповые сообщения между процессами хоста
+# через unix-сокеты: уведомления о завершении аукционов из run_auction_scheduler
+# и несколько процессов Daphne работают только с ним. CHANNEL_LAYER=inmemory -
+# слой в памяти одного процесса (без планировщика), используется в тестах
+CHANNEL_LAYER = os.getenv('CHANNEL_LAYER', 'inmemory' if TESTING else 'local_socket')
+
+if CHANNEL_LAYER == 'local_socket':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'config.channel_layers.LocalSocketChannelLayer',
+            'CONFIG': {
+                'socket_dir': os.getenv('CHANNEL_LAYER_SOCKET_DIR', '/tmp/autoauction-channels'),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Окно (в секундах), за которое AuctionsConsumer объединяет обновления лотов
+AUCTIONS_FEED_WINDOW = float(os.getenv('AUCTIONS_FEED_WINDOW', '0.25'))
+
+# Cache settings
+# По умолчанию общий для всех процессов хоста каталог, чтобы сброс кэша после
+# завершения аукционов в run_auction_scheduler доходил до процессов Daphne.
+# CACHE_BACKEND=locmem - кэш в памяти одного процесса (без планировщика),
+# используется в тестах
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem' if TESTING else 'file')
+
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', '/tmp/autoauction-cache'),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'autoauction',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Время жизни закэшированных ответов списка и карточки лота (в секундах)
+AUCTION_RESPONSE_CACHE_TTL = int(os.getenv('AUCTION_RESPONSE_CACHE_TTL', '60'))
 
 # Email settings
 # Используем автоматическую настройку SMTP на основе указанного email-адреса
@@ -0,0 +1,111 @@
+import asyncio
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .channel_layers import LocalSocketChannelLayer
+from .middleware import TokenUserCache, get_user
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Процесс-получатель: подписывается на группу и считает полученные сообщения
+RECEIVER = textwrap.dedent('''
+    import asyncio
+    import sys
+
+    from config.channel_layers import LocalSocketChannelLayer
+
+    async def main(socket_dir, expected):
+        layer = LocalSocketChannelLayer(socket_dir=socket_dir, capacity=expected)
+        channel = await layer.new_channel()
+        await layer.group_add('burst', channel)
+        print('ready', flush=True)
+        numbers = []
+        try:
+            while len(numbers) < expected:
+                message = await asyncio.wait_for(layer.receive(channel), 10)
+                numbers.append(message['number'])
+        except asyncio.TimeoutError:
+            pass
+        await layer.close()
+        print(len(numbers), int(numbers == sorted(numbers)), flush=True)
+
+    asyncio.run(main(sys.argv[1], int(sys.argv[2])))
+''')
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'unix-сокеты датаграмм Linux')
+class LocalSocketChannelLayerTests(SimpleTestCase):
+    """Рассылка group_send между процессами через LocalSocketChannelLayer"""
+
+    def setUp(self):
+        self.socket_dir = tempfile.mkdtemp(prefix='channels-test-')
+        self.addCleanup(shutil.rmtree, self.socket_dir, True)
+
+    def start_receiver(self, expected):
+        receiver = subprocess.Popen(
+            [sys.executable, '-c', RECEIVER, self.socket_dir, str(expected)],
+            cwd=BACKEND_DIR,
+            stdout=subprocess.PIPE,
+            text=True
+        )
+        self.addCleanup(receiver.kill)
+        self.assertEqual(receiver.stdout.readline().strip(), 'ready')
+        return receiver
+
+    def burst(self, count):
+        async def send_all():
+            layer = LocalSocketChannelLayer(socket_dir=self.socket_dir, peer_refresh=0)
+            # Все сообщения отправляются одновременно, как уведомления о завершении аукционов
+            await asyncio.gather(*(
+                layer.group_send('burst', {'type': 'burst.message', 'number': number})
+                for number in range(count)
+            ))
+            await layer.close()
+        asyncio.run(send_all())
+
+    def test_burst_larger_than_receiver_queue_is_delivered(self):
+        # Очередь датаграмм получателя (max_dgram_qlen) по умолчанию - 10 сообщений
+        for count in (20, 200):
+            with self.subTest(count=count):
+                receiver = self.start_receiver(count)
+                self.burst(count)
+                received, ordered = receiver.communicate(timeout=30)[0].split()
+                self.assertEqual(int(received), count)
+                self.assertEqual(ordered, '1')
+
+
+class TokenUserCacheTests(TransactionTestCase):
+    """
+    Пользователи WebSocket-соединений в общем кэше по jti токена.
+    database_sync_to_async закрывает соединение с БД, поэтому без общей транзакции теста
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('user', 'user@example.com', 'password')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def test_cached_user_needs_no_queries(self):
+        self.assertEqual(async_to_sync(get_user)(self.token), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(get_user)(self.token).username, 'user')
+
+    def test_user_change_reaches_every_process(self):
+        async_to_sync(get_user)(self.token)
+        self.user.is_active = False
+        self.user.save()
+        # Кэш другого процесса читает ту же версию пользователя из общего кэша
+        token = AccessToken(self.token)
+        user = TokenUserCache().user(token['jti'], self.user.id, token['exp'])
+        self.assertFalse(user.is_active)
@@ -5,6 +5,10 @@ from django.conf.urls.static import static
 from django.http import JsonResponse, HttpResponseRedirect
 from django.views.generic import TemplateView
 from django.urls import reverse
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from .outbound import outbound_stats
 
 def api_root(request):
     """
@@ -36,6 +40,12 @@ def redirect_to_admin(request):
 def status_ok(request):
     return JsonResponse({'status': 'ok'})
 
+# Метрики исходящих очередей WebSocket текущего процесса (только для админов, JWT или сессия)
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def websocket_status(request):
+    return Response(outbound_stats())
+
 urlpatterns = [
     path('api/', api_root, name='api-root'),
     # Стандартная админка Django (теперь доступна по адресу /django-admin/)
@@ -55,6 +65,7 @@ urlpatterns = [
     
     # Путь для статуса API (для проверки работоспособности)
     path('api/status/', status_ok, name='api-status'),
+    path('api/status/websocket/', websocket_status, name='api-status-websocket'),
 ]
 
 # Serve media files in development
@@ -10,6 +10,8 @@ from django.utils import timezone
 from django.views.decorators.http import require_POST
 
 from auction.models import Car, Bid, CarImage, AuctionHistory
+from auction.search import get_search_backend
+from chat.history import is_read, read_marks
 from chat.models import Conversation, Message
 
 User = get_user_model()
@@ -104,9 +106,7 @@ def car_list(request):
     # Применение фильтров
     if search_query:
         cars = cars.filter(
-            Q(brand__icontains=search_query) | 
-            Q(model__icontains=search_query) | 
-            Q(description__icontains=search_query) |
+            Q(id__in=get_search_backend().matching(search_query)) |
             Q(seller__username__icontains=search_query)
         )
     
@@ -522,7 +522,14 @@ def chat_list(request):
 def chat_detail(request, pk):
     """Детальная информация о чате"""
     conversation = get_object_or_404(Conversation, pk=pk)
-    messages_list = Message.objects.filter(conversation=conversation).order_by('timestamp')
+    messages_list = list(
+        Message.objects.filter(conversation=conversation).select_related('sender').order_by('timestamp')
+    )
+    
+    # Статус прочтения берется из границ прочтения участников
+    marks = read_marks(conversation)
+    for message in messages_list:
+        message.is_read = is_read(message, marks)
     
     context = {
         'conversation': conversation,
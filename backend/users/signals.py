@@ -1,7 +1,24 @@
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .models import User, Profile
+from .models import User
 
 # The signal handlers have already been defined in models.py
 # This file exists to be imported by the app's ready() method
-# The actual signal handling code remains in models.py
\ No newline at end of file
+# The actual signal handling code remains in models.py
+
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from config.middleware import token_user_cache
+
+@receiver(post_save, sender=User)
+def invalidate_websocket_user(sender, instance, **kwargs):
+    """Сбрасывает кэш пользователей WebSocket при изменении учетной записи"""
+    user_id = instance.id
+    transaction.on_commit(lambda: token_user_cache.invalidate_user(user_id))
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_blacklisted_user(sender, instance, created, **kwargs):
+    """Сбрасывает кэш пользователей WebSocket при выходе (блокировке refresh-токена)"""
+    user_id = instance.token.user_id
+    if created and user_id:
+        transaction.on_commit(lambda: token_user_cache.invalidate_user(user_id))
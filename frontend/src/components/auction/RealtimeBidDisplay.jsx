@@ -1,8 +1,11 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { formatCurrency } from '../../utils/formatDate';
 import { useAuth } from '../../context/AuthContext';
 import websocketManager from '../../utils/realTimeWebSocket';
 
+// Повторный запрос пропущенных ставок, если ответ на resume не пришел
+const RESUME_RETRY_MS = 3000;
+
 /**
  * Компонент для отображения ставок в реальном времени
  * с поддержкой WebSocket для получения актуальных данных
@@ -12,6 +15,10 @@ const RealtimeBidDisplay = ({ auctionId, initialBids = [], onBidUpdate = null })
   const [bids, setBids] = useState(initialBids || []);
   const [lastUpdateTime, setLastUpdateTime] = useState(new Date());
   const [wsStatus, setWsStatus] = useState({ connected: false });
+  // Номер последней полученной ставки (seq) для догона после переподключения
+  const lastSeqRef = useRef(null);
+  // Время запроса догона пропущенных ставок (resume), на который еще нет ответа
+  const resumeRequestedAtRef = useRef(null);
   
   // Сортируем ставки при первоначальной загрузке
   useEffect(() => {
@@ -103,6 +110,35 @@ const RealtimeBidDisplay = ({ auctionId, initialBids = [], onBidUpdate = null })
       const data = typeof message === 'string' ? JSON.parse(message) : message;
       console.log('RealtimeBidDisplay: WebSocket message received:', data);
       
+      // Запоминаем номер последней ставки, известной клиенту
+      if (typeof data.seq === 'number') {
+        if (data.type === 'bid_update' && lastSeqRef.current !== null) {
+          if (data.seq <= lastSeqRef.current) {
+            // Повтор уже примененной ставки (например, после resume)
+            return;
+          }
+          if (data.seq !== lastSeqRef.current + 1) {
+            // Пропущены ставки: запрашиваем их с последней известной и не
+            // применяем кадр - он придет снова вместе с пропущенными
+            const requestedAt = resumeRequestedAtRef.current;
+            if (requestedAt === null || Date.now() - requestedAt > RESUME_RETRY_MS) {
+              console.log(`RealtimeBidDisplay: Bid seq gap ${lastSeqRef.current} -> ${data.seq}, resuming`);
+              resumeRequestedAtRef.current = Date.now();
+              websocketManager.send(`auction/${auctionId}`, {
+                type: 'resume',
+                last_seq: lastSeqRef.current
+              });
+            }
+            return;
+          }
+          lastSeqRef.current = data.seq;
+          resumeRequestedAtRef.current = null;
+        } else if (data.type === 'bid_update' || data.type === 'bids_list' || lastSeqRef.current === null) {
+          lastSeqRef.current = data.seq;
+          resumeRequestedAtRef.current = null;
+        }
+      }
+      
       // Обрабатываем различные типы сообщений
       if (data.type === 'bid_update' && data.bid) {
         console.log('RealtimeBidDisplay: New bid received from WebSocket:', data.bid);
@@ -146,13 +182,21 @@ const RealtimeBidDisplay = ({ auctionId, initialBids = [], onBidUpdate = null })
     } catch (error) {
       console.error('RealtimeBidDisplay: Error processing WebSocket message:', error);
     }
-  }, [addNewBid, onBidUpdate]);
+  }, [auctionId, addNewBid, onBidUpdate]);
   
   // Обрабатывает изменения статуса WebSocket соединения
   const handleWebSocketStatus = useCallback((status) => {
     console.log('RealtimeBidDisplay: WebSocket status changed:', status);
     setWsStatus(status);
-  }, []);
+    
+    // После переподключения запрашиваем только пропущенные ставки
+    if (status.connected && lastSeqRef.current !== null) {
+      websocketManager.send(`auction/${auctionId}`, {
+        type: 'resume',
+        last_seq: lastSeqRef.current
+      });
+    }
+  }, [auctionId]);
   
   // Устанавливаем WebSocket соединение
   useEffect(() => {
@@ -4,7 +4,7 @@ import { useAuth } from '../../context/AuthContext';
 import { formatDateTime } from '../../utils/dateUtils';
 import { fixAvatarUrl } from '../../utils/avatarHelper';
 
-const ChatMessages = ({ conversation, onSendMessage, loading }) => {
+const ChatMessages = ({ conversation, onSendMessage, onLoadEarlier, loading }) => {
   const { user } = useAuth();
   const [message, setMessage] = useState('');
   const messagesEndRef = useRef(null);
@@ -111,6 +111,13 @@ const ChatMessages = ({ conversation, onSendMessage, loading }) => {
       <div className="chat-messages-container" ref={messagesContainerRef}>
         {conversation.messages && conversation.messages.length > 0 ? (
           <div className="chat-messages">
+            {conversation.has_more_messages && onLoadEarlier && (
+              <div className="text-center my-2">
+                <Button variant="link" size="sm" onClick={onLoadEarlier}>
+                  Загрузить предыдущие сообщения
+                </Button>
+              </div>
+            )}
             {conversation.messages.map((msg) => (
               <div 
                 key={msg.id} 
@@ -45,6 +45,16 @@ const ChatWindow = ({ conversation, onUpdate, user }) => {
     };
   }, [conversation]);
 
+  // Временное сообщение соответствует сообщению сервера с тем же temp_id
+  // (для сообщений без temp_id - с тем же текстом и отправителем)
+  const isSameTempMessage = (tempMessage, serverMessage) => {
+    if (serverMessage.temp_id) {
+      return tempMessage.id === serverMessage.temp_id;
+    }
+    return tempMessage.content === serverMessage.content &&
+      tempMessage.sender?.id === serverMessage.sender?.id;
+  };
+
   // Подключение к WebSocket
   const connectToWebSocket = (convId) => {
     // Закрываем предыдущее соединение, если есть
@@ -100,8 +110,7 @@ const ChatWindow = ({ conversation, onUpdate, user }) => {
                 // Отдельно обрабатываем временные сообщения, которые могут быть заменены
                 if (msg.isTemp) {
                   // Проверяем, не соответствует ли временное сообщение полученному от сервера
-                  if (msg.content === data.message.content && 
-                      msg.sender?.id === data.message.sender?.id) {
+                  if (isSameTempMessage(msg, data.message)) {
                     // Запоминаем все временные сообщения для возможной замены
                     tempMessages.push(msg);
                   }
@@ -161,8 +170,7 @@ const ChatWindow = ({ conversation, onUpdate, user }) => {
               // Ищем временное сообщение с таким же содержимым, чтобы заменить его
               const newMessages = prev.messages.map(msg => {
                 // Если это временное сообщение с тем же содержимым и отправителем - заменяем его
-                if (msg.isTemp && msg.content === data.message.content && 
-                    msg.sender.id === data.message.sender.id) {
+                if (msg.isTemp && isSameTempMessage(msg, data.message)) {
                   console.log('Заменяем временное сообщение на подтвержденное:', msg.id, '->', data.message.id);
                   
                   // Удаляем служебные поля перед заменой
@@ -206,6 +214,28 @@ const ChatWindow = ({ conversation, onUpdate, user }) => {
     webSocketRef.current = ws;
   };
 
+  // Загрузка предыдущего окна истории диалога
+  const handleLoadEarlier = async () => {
+    const firstMessage = chatData?.messages?.find(msg => !msg.isTemp);
+    if (!firstMessage) return;
+    
+    try {
+      const data = await chatService.getMessages(chatData.id, { before: firstMessage.id });
+      setChatData(prev => {
+        if (!prev) return prev;
+        const knownIds = new Set(prev.messages.map(msg => msg.id));
+        return {
+          ...prev,
+          messages: [...data.results.filter(msg => !knownIds.has(msg.id)), ...prev.messages],
+          has_more_messages: data.has_more
+        };
+      });
+    } catch (err) {
+      console.error('Ошибка при загрузке предыдущих сообщений:', err);
+      setError('Не удалось загрузить предыдущие сообщения.');
+    }
+  };
+
   // Отправка сообщения через WebSocket с резервным использованием HTTP
   const handleSendMessage = async (content) => {
     if (!chatData || !content.trim()) return;
@@ -255,7 +285,7 @@ const ChatWindow = ({ conversation, onUpdate, user }) => {
       // Если WebSocket не доступен или отправка не удалась, используем HTTP
       if (!wsSuccess) {
         console.log('Отправка через HTTP как запасной вариант:', content);
-        const response = await chatService.sendMessageHttp(chatData.id, content);
+        const response = await chatService.sendMessageHttp(chatData.id, content, tempId);
         console.log('Ответ от HTTP запроса:', response);
         
         // Создаем Map текущих сообщений для быстрого поиска дубликатов
@@ -413,6 +443,7 @@ const ChatWindow = ({ conversation, onUpdate, user }) => {
       <ChatMessages 
         conversation={chatData}
         onSendMessage={handleSendMessage}
+        onLoadEarlier={handleLoadEarlier}
         loading={sendingMessage}
       />
     </div>
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Link } from 'react-router-dom';
 import { getCars, getFilteredCars } from '../api/auction';
 import AuctionCard from '../components/AuctionCard';
@@ -11,6 +11,9 @@ const HomePage = () => {
   const [error, setError] = useState(null);
   const [page, setPage] = useState(1);
   const [hasMore, setHasMore] = useState(true);
+  // Lots the socket is subscribed to, as last reported by the server
+  const subscribedIdsRef = useRef(new Set());
+  const [subscriptionNotice, setSubscriptionNotice] = useState(null);
   
   // Filters
   const [filters, setFilters] = useState({
@@ -84,6 +87,44 @@ const HomePage = () => {
     try {
       const data = JSON.parse(message);
       
+      // Current subscription set confirmed by the server
+      if (data.type === 'subscriptions') {
+        subscribedIdsRef.current = new Set(data.car_ids);
+        return;
+      }
+      
+      // Server refused lots over its subscription cap
+      if (data.type === 'error') {
+        if (data.code === 'subscription_limit') {
+          setSubscriptionNotice(
+            `Обновления в реальном времени доступны не более чем для ${data.max_subscriptions} лотов`
+          );
+        } else {
+          console.error('Auctions WebSocket error:', data.message);
+        }
+        return;
+      }
+      
+      // Handle coalesced lot updates (one frame per feed window)
+      if (data.type === 'auction_updates') {
+        const updates = new Map(data.lots.map(lot => [lot.car_id, lot]));
+        setCars(prevCars => 
+          prevCars.map(car => {
+            const update = updates.get(car.id);
+            if (!update) {
+              return car;
+            }
+            return {
+              ...car,
+              ...(update.current_price !== undefined && { current_price: update.current_price }),
+              ...(update.bid_count !== undefined && { bid_count: update.bid_count }),
+              ...(update.status !== undefined && { status: update.status }),
+            };
+          })
+        );
+        return;
+      }
+      
       // Handle bid update
       if (data.car_id) {
         setCars(prevCars => 
@@ -111,7 +152,31 @@ const HomePage = () => {
   };
   
   // Connect to WebSocket for real-time updates
-  useWebSocket('auctions', handleWsMessage);
+  const { connected, sendMessage } = useWebSocket('auctions', handleWsMessage);
+  
+  // Receive updates only for the lots rendered on the page: lots that left
+  // the page are unsubscribed, new ones are subscribed
+  const carIds = cars.map(car => car.id).join(',');
+  useEffect(() => {
+    if (!connected) {
+      // A new connection starts without subscriptions
+      subscribedIdsRef.current = new Set();
+      return;
+    }
+    const visibleIds = new Set(carIds ? carIds.split(',').map(Number) : []);
+    const subscribedIds = subscribedIdsRef.current;
+    const removed = [...subscribedIds].filter(id => !visibleIds.has(id));
+    const added = [...visibleIds].filter(id => !subscribedIds.has(id));
+    
+    if (removed.length > 0) {
+      sendMessage({ type: 'unsubscribe', car_ids: removed });
+      setSubscriptionNotice(null);
+    }
+    if (added.length > 0) {
+      sendMessage({ type: 'subscribe', car_ids: added });
+    }
+    subscribedIdsRef.current = new Set([...subscribedIds].filter(id => visibleIds.has(id)).concat(added));
+  }, [connected, carIds]);
   
   // Handle filter changes
   const handleFilterChange = (e) => {
@@ -283,6 +348,12 @@ const HomePage = () => {
           </div>
         </div>
         
+        {subscriptionNotice && (
+          <div className="error-message">
+            <p>{subscriptionNotice}</p>
+          </div>
+        )}
+        
         {error && (
           <div className="error-message">
             <p>{error}</p>
@@ -5,6 +5,31 @@ import chatService from '../services/chatService';
 import webSocketService from '../services/webSocketService';
 import { getUserAvatarUrl, handleAvatarError } from '../utils/avatarHelper';
 
+// Время ожидания подтверждения сообщения, отправленного через WebSocket
+const ACK_TIMEOUT_MS = 5000;
+
+// Добавляет подтвержденное сервером сообщение в список: временное сообщение
+// с тем же temp_id заменяется на месте, уже известное по id не дублируется
+const reconcileMessage = (messages, serverMessage) => {
+  if (serverMessage.temp_id) {
+    const tempIndex = messages.findIndex(msg => msg.temp && msg.temp_id === serverMessage.temp_id);
+    if (tempIndex !== -1) {
+      const known = messages.some(msg => !msg.temp && msg.id === serverMessage.id);
+      const updated = [...messages];
+      if (known) {
+        updated.splice(tempIndex, 1);
+      } else {
+        updated[tempIndex] = serverMessage;
+      }
+      return updated;
+    }
+  }
+  if (messages.some(msg => msg.id === serverMessage.id)) {
+    return messages;
+  }
+  return [...messages, serverMessage];
+};
+
 const MessagePage = () => {
   const { conversationId } = useParams();
   const { user, authTokens } = useAuth();
@@ -16,7 +41,15 @@ const MessagePage = () => {
   const [error, setError] = useState(null);
   const [socket, setSocket] = useState(null);
   const [isSending, setIsSending] = useState(false);
+  // Есть ли на сервере сообщения старше загруженных
+  const [hasMoreMessages, setHasMoreMessages] = useState(false);
+  const [loadingEarlier, setLoadingEarlier] = useState(false);
   const messagesEndRef = useRef(null);
+  const messagesContainerRef = useRef(null);
+  // Отправленные через WebSocket сообщения без подтверждения: temp_id -> { timer, content }
+  const pendingAcksRef = useRef(new Map());
+  // Высота списка до подгрузки старых сообщений, чтобы сохранить позицию прокрутки
+  const prependScrollHeightRef = useRef(null);
   
   // Функция для прокрутки вниз к последнему сообщению
   const scrollToBottom = () => {
@@ -110,6 +143,7 @@ const MessagePage = () => {
 
         setConversation(conversationData);
         setMessages(conversationData.messages || []);
+        setHasMoreMessages(Boolean(conversationData.has_more_messages));
         setLoading(false);
       } catch (err) {
         console.error('Ошибка при загрузке диалога:', err);
@@ -172,49 +206,19 @@ const MessagePage = () => {
         try {
           const data = JSON.parse(event.data);
           
-          // Проверяем тип сообщения
-          if (data.type === 'message' && data.message) {
-            console.log('Получено новое сообщение через WebSocket:', data.message);
-            
-            // Проверка, является ли сообщение дубликатом или временным сообщением
-            const isDuplicate = messages.some(msg => 
-              (msg.id === data.message.id) || 
-              (msg.temp && msg.content === data.message.content && 
-               msg.sender && data.message.sender && 
-               msg.sender.id === data.message.sender.id)
-            );
-            
-            if (!isDuplicate) {
-              // Добавляем новое сообщение к списку, заменяя временное если оно есть
-              setMessages(prevMessages => {
-                // Сначала удаляем все временные сообщения с таким же контентом от того же отправителя
-                const filteredMessages = prevMessages.filter(msg => 
-                  !(msg.temp && msg.content === data.message.content && 
-                    msg.sender && data.message.sender && 
-                    msg.sender.id === data.message.sender.id)
-                );
-                
-                // Затем добавляем новое сообщение
-                return [...filteredMessages, data.message];
-              });
-              
-              // Автоматическая прокрутка к новому сообщению
-              scrollToBottom();
+          // Новое сообщение диалога или подтверждение отправки своего:
+          // временное сообщение заменяется по temp_id, повторы по id отбрасываются
+          if ((data.type === 'message' || data.type === 'message_sent') && data.message) {
+            console.log('Получено сообщение диалога через WebSocket:', data.message);
+            const tempId = data.message.temp_id;
+            if (tempId && pendingAcksRef.current.has(tempId)) {
+              clearTimeout(pendingAcksRef.current.get(tempId).timer);
+              pendingAcksRef.current.delete(tempId);
             }
-          } 
-          else if (data.type === 'message_sent' && data.message) {
-            console.log('Получено подтверждение отправки сообщения:', data.message);
+            setMessages(prevMessages => reconcileMessage(prevMessages, data.message));
             
-            // Заменяем временное сообщение на подтвержденное
-            if (data.message.temp_id) {
-              setMessages(prevMessages => {
-                // Ищем временное сообщение по ID и заменяем его
-                const updatedMessages = prevMessages.filter(msg => 
-                  !(msg.temp && msg.id.toString() === data.message.temp_id)
-                );
-                return [...updatedMessages, data.message];
-              });
-            }
+            // Автоматическая прокрутка к новому сообщению
+            scrollToBottom();
           }
           else if (data.type === 'pong') {
             console.log('Получен pong от сервера');
@@ -248,14 +252,59 @@ const MessagePage = () => {
     };
   }, [conversationId, authTokens, conversation]);
 
+  // При уходе из диалога неподтвержденные сообщения сразу досылаются по HTTP,
+  // сервер не создаст дубликат для уже записанного temp_id
+  useEffect(() => {
+    const pendingAcks = pendingAcksRef.current;
+    return () => {
+      pendingAcks.forEach(({ timer, content }, tempId) => {
+        clearTimeout(timer);
+        chatService.sendMessageHttp(conversationId, content, tempId).catch(err => {
+          console.error('Ошибка при досылке сообщения через HTTP:', err);
+        });
+      });
+      pendingAcks.clear();
+    };
+  }, [conversationId]);
+
   // Автоматическая прокрутка к последнему сообщению
   useEffect(() => {
+    const container = messagesContainerRef.current;
+    if (prependScrollHeightRef.current !== null && container) {
+      // Подгружены старые сообщения - остаемся на том же месте списка
+      container.scrollTop += container.scrollHeight - prependScrollHeightRef.current;
+      prependScrollHeightRef.current = null;
+      return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, [messages]);
+
+  // Загрузка сообщений старше самого раннего загруженного
+  const handleLoadEarlier = async () => {
+    const firstMessage = messages.find(msg => !msg.temp);
+    if (!firstMessage || loadingEarlier) return;
+
+    setLoadingEarlier(true);
+    try {
+      const data = await chatService.getMessages(conversationId, { before: firstMessage.id });
+      prependScrollHeightRef.current = messagesContainerRef.current?.scrollHeight ?? null;
+      setMessages(prevMessages => {
+        const knownIds = new Set(prevMessages.map(msg => msg.id));
+        return [...data.results.filter(msg => !knownIds.has(msg.id)), ...prevMessages];
+      });
+      setHasMoreMessages(Boolean(data.has_more));
+    } catch (err) {
+      console.error('Ошибка при загрузке предыдущих сообщений:', err);
+    } finally {
+      setLoadingEarlier(false);
+    }
+  };
   
 
 
-  // Отправка сообщения (пробуем через WebSocket, с fallback на HTTP)
+  // Отправка сообщения (пробуем через WebSocket, с fallback на HTTP).
+  // temp_id создается один раз на сообщение и передается при любой отправке,
+  // поэтому повтор по HTTP не создает дубликат на сервере
   const handleSendMessage = async (e) => {
     e.preventDefault();
     
@@ -267,11 +316,24 @@ const MessagePage = () => {
     setNewMessage(''); // Сразу очищаем поле ввода
     setIsSending(true);
     
+    const tempId = `${Date.now()}_${Math.random().toString(36).slice(2, 10)}`;
+    
+    // Временное сообщение для немедленного отображения, заменяется
+    // подтвержденным сервером сообщением с тем же temp_id
+    const tempMsg = {
+      id: tempId,
+      temp_id: tempId,
+      conversation: parseInt(conversationId),
+      sender: user,
+      content: messageContent,
+      timestamp: new Date().toISOString(),
+      is_read: false,
+      temp: true
+    };
+    setMessages(prevMessages => [...prevMessages, tempMsg]);
+    scrollToBottom();
+    
     try {
-      // Генерируем временный ID для отслеживания сообщения
-      const tempId = Date.now().toString();
-      
-      // Пробуем отправить через WebSocket, если он доступен
       if (socket && socket.readyState === WebSocket.OPEN) {
         console.log('Отправка сообщения через WebSocket');
         socket.send(JSON.stringify({
@@ -280,119 +342,40 @@ const MessagePage = () => {
           temp_id: tempId
         }));
         
-        // Создаем временный объект сообщения для немедленного отображения
-        const tempMsg = {
-          id: tempId,
-          conversation: parseInt(conversationId),
-          sender: user,
-          content: messageContent,
-          timestamp: new Date().toISOString(),
-          is_read: false,
-          temp: true
-        };
-        
-        // Добавляем сообщение в список для моментального отображения
-        setMessages(prevMessages => [...prevMessages, tempMsg]);
+        // Если подтверждение не пришло, досылаем сообщение по HTTP с тем же temp_id
+        const timer = setTimeout(() => {
+          pendingAcksRef.current.delete(tempId);
+          console.log(`Нет подтверждения сообщения ${tempId}, повтор через HTTP`);
+          sendViaHttp(messageContent, tempId);
+        }, ACK_TIMEOUT_MS);
+        pendingAcksRef.current.set(tempId, { timer, content: messageContent });
       } else {
-        // Fallback на HTTP если WebSocket недоступен
         console.log('WebSocket недоступен, отправка через HTTP');
-        
-        // Создаем временный объект сообщения для немедленного отображения
-        const tempMsg = {
-          id: tempId,
-          conversation: parseInt(conversationId),
-          sender: user,
-          content: messageContent,
-          timestamp: new Date().toISOString(),
-          is_read: false,
-          temp: true
-        };
-        
-        // Добавляем временное сообщение в список
-        setMessages(prevMessages => [...prevMessages, tempMsg]);
-        
-        // Отправляем через HTTP и получаем ответ
-        const response = await chatService.sendMessageHttp(conversationId, messageContent);
-        
-        // Заменяем временное сообщение на настоящее
-        if (response && response.id) {
-          setMessages(prevMessages => {
-            // Находим и удаляем временное сообщение
-            const filteredMessages = prevMessages.filter(msg => 
-              !(msg.temp && msg.content === messageContent && 
-                msg.sender && user && 
-                msg.sender.id === user.id)
-            );
-            
-            // Создаем настоящее сообщение
-            const realMsg = {
-              id: response.id,
-              conversation: parseInt(conversationId),
-              sender: user,
-              content: messageContent,
-              timestamp: response.timestamp || new Date().toISOString(),
-              is_read: false
-            };
-            
-            // Добавляем настоящее сообщение
-            return [...filteredMessages, realMsg];
-          });
-        }
+        await sendViaHttp(messageContent, tempId);
       }
-      
-      // Прокручиваем к последнему сообщению
-      scrollToBottom();
-      
     } catch (err) {
-      console.error('Ошибка при отправке сообщения:', err);
-      setError('Не удалось отправить сообщение. Пожалуйста, попробуйте снова.');
-      
-      // Пытаемся отправить через HTTP как последнее средство
+      console.error('Ошибка при отправке сообщения через WebSocket:', err);
+      await sendViaHttp(messageContent, tempId);
+    } finally {
+      setIsSending(false);
+    }
+  };
+  
+  // Отправка по HTTP с одним повтором: для известного temp_id сервер
+  // возвращает уже созданное сообщение
+  const sendViaHttp = async (messageContent, tempId) => {
+    for (let attempt = 0; attempt < 2; attempt++) {
       try {
-        const tempId = Date.now().toString() + "_retry";
-        
-        // Создаем временный объект сообщения для немедленного отображения
-        const tempMsg = {
-          id: tempId,
-          conversation: parseInt(conversationId),
-          sender: user,
-          content: messageContent,
-          timestamp: new Date().toISOString(),
-          is_read: false,
-          temp: true
-        };
-        
-        // Добавляем временное сообщение для отображения
-        setMessages(prevMessages => [...prevMessages, tempMsg]);
-        
-        // Отправляем сообщение через HTTP
-        const response = await chatService.sendMessageHttp(conversationId, messageContent);
-        
-        // Обновляем диалог, чтобы получить актуальные данные
-        const updatedConversation = await chatService.getConversation(conversationId);
-        
-        if (updatedConversation && updatedConversation.messages) {
-          // Фильтруем временные сообщения перед установкой новых
-          setMessages(prevMessages => {
-            // Удаляем временные сообщения
-            const filteredMessages = prevMessages.filter(msg => !msg.temp);
-            
-            // Добавляем актуальные сообщения без дублирования
-            const newMessages = updatedConversation.messages.filter(newMsg => 
-              !filteredMessages.some(existingMsg => existingMsg.id === newMsg.id)
-            );
-            
-            return [...filteredMessages, ...newMessages];
-          });
-          
-          setConversation(updatedConversation);
+        const response = await chatService.sendMessageHttp(conversationId, messageContent, tempId);
+        if (response && response.id) {
+          setMessages(prevMessages => reconcileMessage(prevMessages, response));
         }
-      } catch (fallbackError) {
-        console.error('Ошибка при отправке через HTTP:', fallbackError);
+        return;
+      } catch (err) {
+        console.error('Ошибка при отправке сообщения через HTTP:', err);
       }
-    } finally {
-      setIsSending(false);
     }
+    setError('Не удалось отправить сообщение. Пожалуйста, попробуйте снова.');
   };
 
 
@@ -495,7 +478,19 @@ const MessagePage = () => {
         )}
       </div>
       
-      <div className="messages-container hide-scrollbar">
+      <div className="messages-container hide-scrollbar" ref={messagesContainerRef}>
+        {hasMoreMessages && (
+          <div className="text-center my-2">
+            <button
+              type="button"
+              className="btn btn-link btn-sm"
+              onClick={handleLoadEarlier}
+              disabled={loadingEarlier}
+            >
+              {loadingEarlier ? 'Загрузка...' : 'Загрузить предыдущие сообщения'}
+            </button>
+          </div>
+        )}
         {messages.length > 0 ? (
           messages.map((message, index) => {
             // Строго определяем отправителя сообщения
@@ -540,7 +535,7 @@ const MessagePage = () => {
             
             return (
               <div 
-                key={index} 
+                key={message.id} 
                 className={`message ${isOwnMessage ? 'own-message' : 'other-message'}`}
               >
                 <div 
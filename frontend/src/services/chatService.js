@@ -132,6 +132,21 @@ const chatService = {
     }
   },
 
+  /**
+   * Получение окна истории сообщений диалога
+   * @param {number} conversationId - ID диалога
+   * @param {Object} params - before или after (ID сообщения) и limit
+   */
+  getMessages: async (conversationId, params = {}) => {
+    try {
+      const response = await api.get(`/chat/conversations/${conversationId}/messages/`, { params });
+      return response.data;
+    } catch (error) {
+      console.error(`Ошибка при получении сообщений диалога ${conversationId}:`, error);
+      throw error;
+    }
+  },
+
   /**
    * Отправка сообщения в диалог (предпочитает WebSocket)
    * @param {number} conversationId - ID диалога
@@ -168,12 +183,14 @@ const chatService = {
    * Отправка сообщения в диалог только через HTTP (без WebSocket)
    * @param {number} conversationId - ID диалога
    * @param {string} content - Текст сообщения
+   * @param {string} [tempId] - Временный ID сообщения, повторная отправка с ним не создает дубликат
    */
-  sendMessageHttp: async (conversationId, content) => {
+  sendMessageHttp: async (conversationId, content, tempId = null) => {
     try {
       console.log('Отправка сообщения через HTTP (чистый режим):', content);
       const response = await api.post(`/chat/conversations/${conversationId}/messages/`, {
-        content
+        content,
+        ...(tempId ? { temp_id: tempId } : {})
       });
       console.log('Успешный ответ от сервера при отправке сообщения:', response.data);
       return response.data;